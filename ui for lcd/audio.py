@@ -0,0 +1,866 @@
+import os
+import time
+import queue
+import sqlite3
+import hashlib
+import logging
+import threading
+import subprocess
+import requests
+import numpy as np
+import sounddevice as sd
+from scipy.signal import lfilter, butter, sosfilt, sosfilt_zi
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_PATH = "/usr/bin/ffmpeg"
+
+# Decoded audio cache settings
+AUDIO_CACHE_DIR = os.environ.get("AUDIO_CACHE_DIR", "audio_cache")
+AUDIO_CACHE_MAX_MB = float(os.environ.get("AUDIO_CACHE_MAX_MB", "256"))
+AUDIO_CACHE_REVALIDATE = 3600  # Seconds before a cached URL is checked again
+AUDIO_RATE = 44100  # Sample rate of all decoded audio
+AUDIO_BLOCK = 4410  # Samples per decoded block (100 ms)
+AUDIO_TIMEOUT = 30  # Seconds for audio downloads
+SAMPLE_BYTES = 4  # float32 mono
+
+# Loudness normalization settings
+TARGET_LUFS = -16.0  # Integrated loudness every clip is brought to
+MAX_GAIN_DB = 20.0  # Never boost more than this, so near-silent clips stay quiet
+PEAK_CEILING = 0.98  # Never boost a clip's peak past this
+
+# Voice recorder DSP settings
+VOICE_BAND = (200.0, 3000.0)  # Hz kept by the band-pass
+GATE_THRESHOLD_DB = -45.0  # Level below which the expander starts attenuating
+GATE_RATIO = 4.0  # Downward expansion ratio below the threshold
+GATE_FLOOR_DB = -40.0  # Most the expander will attenuate
+GATE_ATTACK = 0.005  # Seconds for the gain to open
+GATE_RELEASE = 0.15  # Seconds for the gain to close
+GATE_STEP = 0.005  # Seconds per envelope step
+
+# Voice activity detection settings
+VAD_ENABLED = os.environ.get("VOICE_VAD", "1") == "1"
+VAD_SILENCE_TIMEOUT = float(os.environ.get("VOICE_SILENCE_TIMEOUT", "8"))  # Seconds of silence before auto-stop, 0 to disable
+VAD_FRAME = 0.02  # Seconds per detection frame
+VAD_MARGIN_DB = 12.0  # Speech must be this far above the noise floor
+VAD_MIN_DB = -50.0  # and never quieter than this
+VAD_NOISE_RISE_DB = 0.5  # dB per second the noise floor may creep up once speech was heard
+VAD_NOISE_ADAPT_DB = 10.0  # dB per second it may rise before that, to settle on the room's noise
+VAD_HANGOVER = 0.3  # Seconds kept after speech ends, so word endings are not clipped
+VAD_PREROLL = 0.2  # Seconds kept before speech starts
+VAD_MAX_PAUSE = 1.0  # Longest pause kept between two stretches of speech
+
+# Voice note encoding profiles: ffmpeg output arguments plus what to record about the file
+VOICE_PROFILES = {
+    # Full-band MP3, the largest files
+    'hifi': {
+        'codec': 'mp3', 'extension': 'mp3', 'content_type': 'audio/mpeg', 'rate': 48000,
+        'args': ['-codec:a', 'libmp3lame', '-qscale:a', '0', '-ar', '48000', '-f', 'mp3'],
+    },
+    # 16 kHz mono MP3 at 16 kbps: covers the 200-3000 Hz voice band and plays everywhere
+    'speech': {
+        'codec': 'mp3', 'extension': 'mp3', 'content_type': 'audio/mpeg', 'rate': 16000,
+        'args': ['-codec:a', 'libmp3lame', '-b:a', '16k', '-ar', '16000', '-ac', '1', '-f', 'mp3'],
+    },
+    # 16 kHz Opus at 12 kbps for metered links, where every player understands Ogg Opus
+    'opus': {
+        'codec': 'opus', 'extension': 'ogg', 'content_type': 'audio/ogg', 'rate': 16000,
+        'args': ['-codec:a', 'libopus', '-b:a', '12k', '-application', 'voip', '-ar', '16000', '-ac', '1', '-f', 'ogg'],
+    },
+}
+VOICE_PROFILE = os.environ.get("VOICE_PROFILE", "speech")
+
+# ffmpeg demuxer for each recorded codec, so decoding starts without probing
+CODEC_FORMATS = {'mp3': 'mp3', 'opus': 'ogg', 'vorbis': 'ogg', 'aac': 'aac', 'wav': 'wav'}
+
+# Output engine settings
+ENGINE_BLOCK = 1024  # Samples per output callback
+ENGINE_QUEUE_BLOCKS = 10  # Decoded blocks read ahead per source (1 s)
+CHANNEL_PRIORITY = {'voice': 0, 'reminder': 1, 'emergency': 2}
+DUCK_GAIN = 0.2  # Gain of lower priority channels while a higher one plays
+
+
+class DecodedAudio:
+    """Mono float32 PCM of one clip, readable while it is still being decoded.
+
+    The samples live in a raw PCM file in the audio cache; readers pull
+    blocks from it by sample offset, so memory use does not depend on clip
+    length. While a decode is running, frames is the number of samples
+    written so far and readers that get ahead of it wait for more.
+    """
+
+    def __init__(self, path, rate, frames=0, complete=False, gain=None):
+        self.path = path
+        self.rate = rate
+        self.frames = frames
+        self.complete = complete
+        self.gain = gain  # Loudness normalization gain, known once complete
+        self.error = None
+        self.condition = threading.Condition()
+
+    @property
+    def duration(self):
+        return self.frames / self.rate
+
+    def blocks(self, start=0, blocksize=AUDIO_BLOCK, prebuffer=0, stop_event=None):
+        """Yield blocks from sample start, waiting for the decoder when needed.
+
+        Whenever the reader catches up with the decoder it waits until
+        prebuffer samples are ready again (a jitter buffer against a bursty
+        download). Returns early once stop_event is set.
+        """
+        position = start
+        with open(self.path, 'rb') as f:
+            while True:
+                with self.condition:
+                    if self.frames - position < blocksize:
+                        while (self.frames < position + max(prebuffer, 1) and not self.complete
+                               and self.error is None):
+                            if stop_event is not None and stop_event.is_set():
+                                return
+                            self.condition.wait(timeout=0.1)
+                    if self.error is not None:
+                        raise self.error
+                    available = self.frames - position
+                if available <= 0:
+                    return
+                f.seek(position * SAMPLE_BYTES)
+                block = np.fromfile(f, dtype=np.float32, count=min(blocksize, available))
+                if len(block) == 0:
+                    return
+                position += len(block)
+                yield block
+
+    def _append(self, block):
+        with self.condition:
+            self.frames += len(block)
+            self.condition.notify_all()
+
+    def _finish(self, gain=None, error=None):
+        with self.condition:
+            self.complete = error is None
+            self.gain = gain
+            self.error = error
+            self.condition.notify_all()
+
+
+def k_weighting(rate):
+    """Biquad coefficients of the ITU-R BS.1770 K-weighting filter at rate"""
+    # Stage 1: high shelf modelling the acoustic effect of the head
+    K = np.tan(np.pi * 1681.974450955533 / rate)
+    Q = 0.7071752369554196
+    Vh = 10 ** (3.999843853973347 / 20)
+    Vb = Vh ** 0.4996667741545416
+    a0 = 1 + K / Q + K * K
+    shelf = ([(Vh + Vb * K / Q + K * K) / a0, 2 * (K * K - Vh) / a0, (Vh - Vb * K / Q + K * K) / a0],
+             [1.0, 2 * (K * K - 1) / a0, (1 - K / Q + K * K) / a0])
+    # Stage 2: RLB high pass
+    K = np.tan(np.pi * 38.13547087602444 / rate)
+    Q = 0.5003270373238773
+    a0 = 1 + K / Q + K * K
+    highpass = ([1.0, -2.0, 1.0], [1.0, 2 * (K * K - 1) / a0, (1 - K / Q + K * K) / a0])
+    return shelf, highpass
+
+
+class LoudnessMeter:
+    """Integrated loudness (LUFS) of a mono signal, measured block by block.
+
+    Follows ITU-R BS.1770: K-weighted mean square over 400 ms windows with
+    75% overlap, an absolute gate at -70 LUFS and a relative gate 10 LU
+    below the ungated level. Only the 100 ms sub-block energies are kept,
+    so a whole clip can be measured while it streams past.
+    """
+
+    def __init__(self, rate=AUDIO_RATE):
+        self.rate = rate
+        self.step = rate // 10  # 100 ms sub-blocks
+        self.filters = [(b, a, np.zeros(2)) for b, a in k_weighting(rate)]
+        self.leftover = np.zeros(0, dtype=np.float64)
+        self.energies = []
+        self.peak = 0.0
+
+    def add(self, block):
+        if len(block) == 0:
+            return
+        self.peak = max(self.peak, float(np.max(np.abs(block))))
+        weighted = np.asarray(block, dtype=np.float64)
+        for i, (b, a, state) in enumerate(self.filters):
+            weighted, state = lfilter(b, a, weighted, zi=state)
+            self.filters[i] = (b, a, state)
+        weighted = np.concatenate((self.leftover, weighted))
+        whole = len(weighted) - len(weighted) % self.step
+        if whole:
+            self.energies.extend(np.mean(weighted[:whole].reshape(-1, self.step) ** 2, axis=1))
+        self.leftover = weighted[whole:]
+
+    def integrated(self):
+        """Gated loudness in LUFS, or None for clips shorter than one window or silent ones"""
+        energies = np.array(self.energies)
+        if len(energies) < 4:
+            return None
+        windows = np.convolve(energies, np.ones(4) / 4, mode='valid')
+        with np.errstate(divide='ignore'):
+            loudness = -0.691 + 10 * np.log10(windows)
+        gated = windows[loudness > -70.0]
+        if len(gated) == 0:
+            return None
+        relative = -0.691 + 10 * np.log10(np.mean(gated)) - 10.0
+        gated = windows[(loudness > -70.0) & (loudness > relative)]
+        return -0.691 + 10 * np.log10(np.mean(gated))
+
+    def gain(self, target=TARGET_LUFS):
+        """Linear gain that brings the clip to target without clipping its peak"""
+        loudness = self.integrated()
+        if loudness is None:
+            return None
+        gain = 10 ** (min(target - loudness, MAX_GAIN_DB) / 20)
+        if self.peak > 0:
+            gain = min(gain, PEAK_CEILING / self.peak)
+        return float(gain)
+
+
+class VoiceProcessor:
+    """Streaming clean-up chain for the voice recorder.
+
+    Each block goes through a DC blocker, a 4th order Butterworth band-pass
+    over VOICE_BAND and a downward expander that pushes room noise down
+    between words instead of hard-gating individual samples. Filter and
+    envelope state carry over between blocks, so blocks of any size can be
+    processed as they arrive with constant memory.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.dc_state = np.zeros(1)
+        self.band = butter(2, VOICE_BAND, btype='bandpass', fs=rate, output='sos')
+        self.band_state = sosfilt_zi(self.band) * 0.0
+        self.step = max(1, int(GATE_STEP * rate))
+        self.attack = np.exp(-GATE_STEP / GATE_ATTACK)
+        self.release = np.exp(-GATE_STEP / GATE_RELEASE)
+        self.gain_db = 0.0
+        self.leftover = np.zeros(0, dtype=np.float32)
+
+    def process(self, block):
+        """Clean one block; returns the processed samples, possibly a few fewer or more than given"""
+        x = np.asarray(block, dtype=np.float64)
+        # DC blocker: y[n] = x[n] - x[n-1] + 0.995 y[n-1]
+        x, self.dc_state = lfilter([1.0, -1.0], [1.0, -0.995], x, zi=self.dc_state)
+        x, self.band_state = sosfilt(self.band, x, zi=self.band_state)
+
+        # The expander works on whole envelope steps; keep the tail for the next block
+        x = np.concatenate((self.leftover, x))
+        whole = len(x) - len(x) % self.step
+        self.leftover = x[whole:]
+        if not whole:
+            return np.zeros(0, dtype=np.float32)
+        steps = x[:whole].reshape(-1, self.step)
+        with np.errstate(divide='ignore'):
+            level_db = 10 * np.log10(np.mean(steps ** 2, axis=1) + 1e-12)
+        target_db = np.clip((level_db - GATE_THRESHOLD_DB) * (GATE_RATIO - 1), GATE_FLOOR_DB, 0.0)
+        gains_db = np.empty(len(target_db))
+        gain_db = self.gain_db
+        for i, target in enumerate(target_db):
+            coefficient = self.attack if target > gain_db else self.release
+            gain_db = target + (gain_db - target) * coefficient
+            gains_db[i] = gain_db
+        # Interpolate the per-step gain across samples to avoid zipper noise
+        previous = np.concatenate(([self.gain_db], gains_db[:-1]))
+        ramp = np.linspace(0.0, 1.0, self.step, endpoint=False)
+        gains = 10 ** ((previous[:, np.newaxis] + (gains_db - previous)[:, np.newaxis] * ramp) / 20)
+        self.gain_db = gain_db
+        return (steps * gains).reshape(-1).astype(np.float32)
+
+
+class VoiceActivityDetector:
+    """Energy based speech detector that passes on speech and drops the silence around it.
+
+    Frames louder than an adaptive noise floor by VAD_MARGIN_DB count as
+    speech. The floor starts at the level of the first frame and follows
+    the room up quickly until the first word, so steady background noise
+    is never mistaken for speech; after that it only creeps up. Silence
+    before the first word is dropped except for a short pre-roll, pauses
+    between words are shortened to VAD_MAX_PAUSE and anything after the
+    last word plus the hangover is never passed on, so what reaches the
+    encoder scales with how long someone actually spoke. At most
+    VAD_MAX_PAUSE of audio is held back at any time.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.frame = max(1, int(VAD_FRAME * rate))
+        self.hangover = int(VAD_HANGOVER / VAD_FRAME)
+        self.preroll = int(VAD_PREROLL / VAD_FRAME)
+        self.max_pause = int(VAD_MAX_PAUSE / VAD_FRAME)
+        self.noise_rise = VAD_NOISE_RISE_DB * VAD_FRAME
+        self.noise_adapt = VAD_NOISE_ADAPT_DB * VAD_FRAME
+        self.noise_db = None  # Measured from the first frame on
+        self.leftover = np.zeros(0, dtype=np.float32)
+        self.held = []  # Silent frames not yet passed on
+        self.heard_speech = False
+        self.quiet_frames = 0  # Non-speech frames since the last speech, or since the start
+        self.total_frames = 0
+        self.speech_frames = 0
+
+    def process(self, block):
+        """Detect speech in one block; returns the samples worth encoding, possibly none"""
+        x = np.concatenate((self.leftover, np.asarray(block, dtype=np.float32)))
+        whole = len(x) - len(x) % self.frame
+        self.leftover = x[whole:]
+        frames = x[:whole].reshape(-1, self.frame)
+        with np.errstate(divide='ignore'):
+            levels_db = 10 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-12)
+
+        out = []
+        for frame, level_db in zip(frames, levels_db):
+            self.total_frames += 1
+            if self.noise_db is None:
+                self.noise_db = level_db
+            # The floor drops straight to quieter frames and rises slowly once speech was heard
+            rise = self.noise_rise if self.heard_speech else self.noise_adapt
+            self.noise_db = min(level_db, self.noise_db + rise)
+            if level_db > max(self.noise_db + VAD_MARGIN_DB, VAD_MIN_DB):
+                self.speech_frames += 1
+                self.quiet_frames = 0
+                out.extend(self.held)  # Pre-roll or the kept part of the pause
+                self.held = []
+                self.heard_speech = True
+                out.append(frame)
+                continue
+
+            self.quiet_frames += 1
+            if self.heard_speech and self.quiet_frames <= self.hangover:
+                out.append(frame)
+                continue
+            self.held.append(frame)
+            limit = self.max_pause if self.heard_speech else self.preroll
+            if len(self.held) > limit:
+                del self.held[:len(self.held) - limit]
+
+        if not out:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(out)
+
+    @property
+    def silence(self):
+        """Seconds since speech was last heard, or since the start if it never was"""
+        return self.quiet_frames * self.frame / self.rate
+
+    def speech_ratio(self):
+        """Fraction of the frames seen so far that held speech"""
+        return self.speech_frames / self.total_frames if self.total_frames else 0.0
+
+
+class StreamEncoder:
+    """ffmpeg encoder fed PCM blocks on stdin, its output pumped into sink as it is produced"""
+
+    def __init__(self, output_args, rate, sink):
+        self.command = [
+            FFMPEG_PATH, '-loglevel', 'error',
+            '-f', 'f32le', '-ar', str(rate), '-ac', '1', '-i', '-',
+        ] + output_args + ['-']
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.sink = sink
+        self.pump = threading.Thread(target=self._pump, daemon=True)
+        self.pump.start()
+
+    def write(self, block):
+        try:
+            self.process.stdin.write(np.asarray(block, dtype=np.float32).tobytes())
+        except BrokenPipeError:
+            pass  # ffmpeg exited early, its error is reported by close()
+
+    def close(self):
+        """Flush the encoder; raises CalledProcessError if it failed"""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.pump.join()
+        if self.process.wait() != 0:
+            raise subprocess.CalledProcessError(self.process.returncode, self.command,
+                                                stderr=self.process.stderr.read())
+
+    def abort(self):
+        """Stop the encoder without waiting for its output"""
+        self.process.kill()
+        self.pump.join()
+
+    def _pump(self):
+        while True:
+            data = self.process.stdout.read(64 * 1024)
+            if not data:
+                return
+            self.sink.write(data)
+
+
+class BufferedAudio:
+    """Samples already in memory, read with the same blocks() interface as DecodedAudio"""
+
+    def __init__(self, samples, rate=AUDIO_RATE):
+        self.samples = samples
+        self.rate = rate
+        self.frames = len(samples)
+        self.complete = True
+        self.gain = None
+
+    @property
+    def duration(self):
+        return self.frames / self.rate
+
+    def blocks(self, start=0, blocksize=AUDIO_BLOCK, prebuffer=0, stop_event=None):
+        for position in range(start, self.frames, blocksize):
+            if stop_event is not None and stop_event.is_set():
+                return
+            yield self.samples[position:position + blocksize]
+
+
+def emergency_tone(seconds=3.0, rate=AUDIO_RATE):
+    """Two-tone alarm alternating every quarter second"""
+    t = np.arange(int(seconds * rate), dtype=np.float32) / rate
+    frequency = np.where((t * 4).astype(int) % 2 == 0, 880.0, 660.0).astype(np.float32)
+    return BufferedAudio((0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32), rate)
+
+
+def decode_stream(chunks, sink, rate=AUDIO_RATE, codec=None):
+    """Decode encoded audio chunks to mono float32 PCM, calling sink(block) as samples arrive.
+
+    The encoded bytes are piped through ffmpeg as they are downloaded, and
+    decoded samples are handed on one block at a time, so nothing is ever
+    held in memory or on disk in full. A known codec picks the demuxer
+    directly; otherwise ffmpeg probes the stream.
+    """
+    input_format = ['-f', CODEC_FORMATS[codec]] if codec in CODEC_FORMATS else []
+    process = subprocess.Popen([
+        FFMPEG_PATH, '-loglevel', 'error',
+    ] + input_format + [
+        '-i', '-',
+        '-f', 'f32le', '-ac', '1', '-ar', str(rate),
+        '-'
+    ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def feed():
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            pass  # ffmpeg exited early, its error is reported below
+        except Exception as e:
+            logger.error(f"Error reading audio download: {e}")
+            process.kill()
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    block_bytes = AUDIO_BLOCK * SAMPLE_BYTES
+    pending = b''
+    while True:
+        data = process.stdout.read(block_bytes)
+        if not data:
+            break
+        data = pending + data
+        usable = len(data) - len(data) % SAMPLE_BYTES
+        pending = data[usable:]
+        if usable:
+            sink(np.frombuffer(data[:usable], dtype=np.float32))
+    feeder.join()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, FFMPEG_PATH, stderr=process.stderr.read())
+
+
+class AudioCache:
+    """Disk cache of decoded audio, so replays skip the download and decode.
+
+    Each URL maps to one raw float32 PCM file named after a hash of the URL
+    and the ETag (or generation) it was downloaded at. open() serves a
+    cached entry straight from disk without touching the network; on a
+    miss it streams the download through the decoder into the cache file
+    and returns a DecodedAudio that can be played while that is happening.
+    At most once every AUDIO_CACHE_REVALIDATE seconds a hit is also
+    revalidated in the background with a conditional GET, and a changed
+    object is fetched and decoded for the next play. Concurrent opens of a
+    URL that is still downloading share that one download. The index lives in
+    SQLite next to the PCM files, and the least recently played entries are
+    evicted once the cache grows past AUDIO_CACHE_MAX_MB.
+    """
+
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.revalidating = set()  # URLs with a conditional GET in flight
+        self.fetching = {}  # Per-URL locks, so one URL is never downloaded twice at once
+        self.decoding = {}  # DecodedAudio of downloads still in progress, by URL
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS audio (
+                                 url TEXT PRIMARY KEY,
+                                 etag TEXT,
+                                 file TEXT,
+                                 size INTEGER,
+                                 rate INTEGER,
+                                 checked REAL,
+                                 used REAL)""")
+        self._add_column("gain", "REAL")
+        self.conn.commit()
+        self._remove_orphans()
+
+    def open(self, url, codec=None):
+        """DecodedAudio for url, from disk when cached, otherwise decoded as it downloads"""
+        with self.lock:
+            fetch = self.fetching.setdefault(url, threading.Lock())
+        with fetch:
+            with self.lock:
+                row = self.conn.execute("SELECT etag, file, size, rate, checked, gain FROM audio WHERE url = ?",
+                                        (url,)).fetchone()
+                audio = self.decoding.get(url)
+            if audio is not None:
+                logger.debug(f"Sharing the download of {url} already in progress")
+                return audio
+            if row is not None:
+                etag, file, size, rate, checked, gain = row
+                path = os.path.join(self.directory, file)
+                if os.path.exists(path):
+                    with self.lock, self.conn:
+                        self.conn.execute("UPDATE audio SET used = ? WHERE url = ?", (time.time(), url))
+                    if time.time() - checked > AUDIO_CACHE_REVALIDATE:
+                        self._revalidate_later(url, etag)
+                    return DecodedAudio(path, rate, frames=size // SAMPLE_BYTES, complete=True, gain=gain)
+                logger.warning(f"Cached audio for {url} is missing, downloading again")
+
+            response = requests.get(url, stream=True, timeout=AUDIO_TIMEOUT)
+            response.raise_for_status()
+            return self._decode(url, response, codec=codec)
+
+    def _decode(self, url, response, wait=False, codec=None):
+        """Decode a download into the cache, in the background unless wait is set"""
+        etag = response.headers.get('ETag') or response.headers.get('x-goog-generation') or ''
+        file = hashlib.sha256(f"{url}\n{etag}".encode()).hexdigest() + ".pcm"
+        path = os.path.join(self.directory, file)
+        open(path, 'wb').close()
+        audio = DecodedAudio(path, AUDIO_RATE)
+        if not wait:
+            with self.lock:
+                self.decoding[url] = audio
+
+        def run():
+            # Loudness is measured once here, as the clip is decoded, and cached with it
+            meter = LoudnessMeter(AUDIO_RATE)
+            try:
+                with open(path, 'ab') as f:
+                    def sink(block):
+                        block.tofile(f)
+                        f.flush()
+                        meter.add(block)
+                        audio._append(block)
+                    decode_stream(response.iter_content(chunk_size=64 * 1024), sink, codec=codec)
+            except Exception as e:
+                logger.error(f"Error decoding audio from {url}: {e}")
+                self._remove_file(file)
+                with self.lock:
+                    self._end_decode(url, audio)
+                audio._finish(error=e)
+                return
+            finally:
+                response.close()
+
+            gain = meter.gain()
+            with self.lock:
+                old = self.conn.execute("SELECT file FROM audio WHERE url = ?", (url,)).fetchone()
+                with self.conn:
+                    self.conn.execute("INSERT OR REPLACE INTO audio (url, etag, file, size, rate, checked, used, gain) "
+                                      "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                      (url, etag, file, audio.frames * SAMPLE_BYTES, AUDIO_RATE,
+                                       time.time(), time.time(), gain))
+                if old is not None and old[0] != file:
+                    self._remove_file(old[0])
+                self._evict()
+                self._end_decode(url, audio)
+            audio._finish(gain=gain)
+            logger.debug(f"Cached {audio.duration:.1f}s of audio for {url}")
+
+        if wait:
+            run()
+        else:
+            threading.Thread(target=run, daemon=True).start()
+        return audio
+
+    def _end_decode(self, url, audio):
+        """Stop sharing a finished download; called with the lock held"""
+        if self.decoding.get(url) is audio:
+            del self.decoding[url]
+
+    def _revalidate_later(self, url, etag):
+        with self.lock:
+            if url in self.revalidating:
+                return
+            self.revalidating.add(url)
+
+        def revalidate():
+            try:
+                response = requests.get(url, headers={'If-None-Match': etag}, stream=True, timeout=AUDIO_TIMEOUT)
+                if response.status_code == 304:
+                    response.close()
+                    with self.lock, self.conn:
+                        self.conn.execute("UPDATE audio SET checked = ? WHERE url = ?", (time.time(), url))
+                    return
+                response.raise_for_status()
+                self._decode(url, response, wait=True)
+                logger.info(f"Cached audio for {url} was out of date and has been refreshed")
+            except Exception as e:
+                logger.debug(f"Could not revalidate cached audio for {url}: {e}")
+            finally:
+                with self.lock:
+                    self.revalidating.discard(url)
+
+        threading.Thread(target=revalidate, daemon=True).start()
+
+    def _evict(self):
+        """Drop least recently played entries until the cache fits; called with the lock held"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM audio").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT url, file, size FROM audio ORDER BY used").fetchall()
+        with self.conn:
+            for url, file, size in rows[:-1]:  # Always keep the newest entry
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM audio WHERE url = ?", (url,))
+                self._remove_file(file)
+                total -= size
+                logger.debug(f"Evicted cached audio for {url}")
+
+    def _add_column(self, name, kind):
+        """Add a column to an index created by an older version"""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(audio)")]
+        if name not in columns:
+            self.conn.execute(f"ALTER TABLE audio ADD COLUMN {name} {kind}")
+
+    def _remove_orphans(self):
+        """Delete PCM files left behind by decodes that never finished"""
+        known = {row[0] for row in self.conn.execute("SELECT file FROM audio")}
+        for entry in os.listdir(self.directory):
+            if entry.endswith('.pcm') and entry not in known:
+                self._remove_file(entry)
+
+    def _remove_file(self, file):
+        try:
+            os.remove(os.path.join(self.directory, file))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Could not remove cached audio {file}: {e}")
+
+
+class Source:
+    """One clip playing on a mixer channel.
+
+    A feeder thread reads blocks from the clip into a short queue so the
+    output callback never waits on disk or the network; the callback only
+    takes blocks off that queue and advances position.
+    """
+
+    def __init__(self, audio, channel, gain=None, start=0, prebuffer=0, on_done=None):
+        self.audio = audio
+        self.channel = channel
+        # Fixed for the whole play, so a gain measured mid-clip can't jump the level;
+        # a clip still decoding plays at unity this time and normalized from then on
+        self.gain = gain if gain is not None else (audio.gain or 1.0)
+        self.level = self.gain  # Gain actually applied, ramped towards the ducked target
+        self.prebuffer = prebuffer
+        self.position = start  # Samples handed to the device
+        self.paused = False
+        self.on_done = on_done
+        self.done = threading.Event()
+        self.block = None
+        self.offset = 0
+        self.queue, self.stop_event = self._start_feeder(start)
+
+    def _start_feeder(self, start):
+        blocks = queue.Queue(maxsize=ENGINE_QUEUE_BLOCKS)
+        stop_event = threading.Event()
+
+        def feed():
+            try:
+                for block in self.audio.blocks(start, prebuffer=self.prebuffer, stop_event=stop_event):
+                    while not stop_event.is_set():
+                        try:
+                            blocks.put(block, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stop_event.is_set():
+                        return
+            except Exception as e:
+                logger.error(f"Error reading audio for {self.channel}: {e}")
+            blocks.put(None)  # End of clip
+
+        threading.Thread(target=feed, daemon=True).start()
+        return blocks, stop_event
+
+    def read_into(self, out, target):
+        """Mix up to len(out) samples into out; returns False once the clip has ended"""
+        frames = len(out)
+        ramp = None
+        if self.level != target:
+            ramp = np.linspace(self.level, target, frames, dtype=np.float32)
+            self.level = target
+        filled = 0
+        while filled < frames:
+            if self.block is None:
+                try:
+                    self.block = self.queue.get_nowait()
+                except queue.Empty:
+                    break  # Underrun, the feeder has not caught up yet
+                self.offset = 0
+                if self.block is None:
+                    return False
+            take = min(frames - filled, len(self.block) - self.offset)
+            gain = ramp[filled:filled + take] if ramp is not None else target
+            out[filled:filled + take] += self.block[self.offset:self.offset + take] * gain
+            self.offset += take
+            filled += take
+            if self.offset >= len(self.block):
+                self.block = None
+        self.position += filled
+        return True
+
+
+class AudioEngine:
+    """One long-lived output stream that mixes every sound the device plays.
+
+    Each mixer channel (voice note, task reminder, emergency tone) holds at
+    most one Source. While a higher priority channel is playing, lower ones
+    are ducked to DUCK_GAIN rather than cut. Callers never touch the
+    stream: play/pause/resume/seek/stop post commands to a queue that the
+    output callback drains at the start of every block, so pausing is just
+    a flag and resuming continues from the same buffered samples.
+    """
+
+    def __init__(self, rate=AUDIO_RATE):
+        self.rate = rate
+        self.stream = None
+        self.sources = {}  # Owned by the output callback
+        self.commands = queue.SimpleQueue()
+        self.finished = queue.SimpleQueue()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Open the output stream; returns False when no device is available"""
+        with self.lock:
+            if self.stream is not None:
+                return True
+            try:
+                self.stream = sd.OutputStream(samplerate=self.rate, channels=1, dtype=np.float32,
+                                              blocksize=ENGINE_BLOCK, callback=self._callback)
+                self.stream.start()
+            except Exception as e:
+                logger.error(f"Could not open audio output: {e}")
+                self.stream = None
+                return False
+        threading.Thread(target=self._notify_finished, daemon=True).start()
+        logger.debug(f"Audio engine started at {self.rate} Hz")
+        return True
+
+    def close(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+        self.finished.put(None)
+
+    def play(self, channel, audio, gain=None, start=0, prebuffer=0, on_done=None):
+        """Start audio on channel, replacing whatever it was playing; None if there is no output device"""
+        if not self.start():
+            return None
+        source = Source(audio, channel, gain, start, prebuffer, on_done)
+        self.commands.put(('play', channel, source))
+        return source
+
+    def pause(self, channel):
+        self.commands.put(('pause', channel, None))
+
+    def resume(self, channel):
+        self.commands.put(('resume', channel, None))
+
+    def seek(self, channel, seconds):
+        source = self.sources.get(channel)
+        if source is None:
+            return
+        # Start reading at the new position here, the callback only swaps queues
+        position = int(seconds * self.rate)
+        blocks, stop_event = source._start_feeder(position)
+        self.commands.put(('seek', channel, (source, position, blocks, stop_event)))
+
+    def stop(self, channel):
+        self.commands.put(('stop', channel, None))
+
+    def source(self, channel):
+        """The Source playing or paused on channel, if any"""
+        return self.sources.get(channel)
+
+    def _callback(self, outdata, frames, time_info, status):
+        while True:
+            try:
+                command, channel, argument = self.commands.get_nowait()
+            except queue.Empty:
+                break
+            self._apply(command, channel, argument)
+
+        out = outdata[:, 0]
+        out.fill(0)
+        active = [source for source in self.sources.values() if not source.paused]
+        top = max((CHANNEL_PRIORITY[source.channel] for source in active), default=0)
+        for source in active:
+            target = source.gain * (DUCK_GAIN if CHANNEL_PRIORITY[source.channel] < top else 1.0)
+            if not source.read_into(out, target):
+                del self.sources[source.channel]
+                source.done.set()
+                self.finished.put(source)
+        np.clip(out, -1.0, 1.0, out=out)
+
+    def _apply(self, command, channel, argument):
+        """Run one queued command; called from the output callback"""
+        source = self.sources.get(channel)
+        if command == 'play':
+            if source is not None:
+                self._discard(source)
+            self.sources[channel] = argument
+        elif command == 'seek':
+            target, position, blocks, stop_event = argument
+            if target is not source:
+                stop_event.set()  # The channel moved on to another clip
+                return
+            source.stop_event.set()
+            source.queue, source.stop_event = blocks, stop_event
+            source.block = None
+            source.position = position
+        elif source is None:
+            return
+        elif command == 'pause':
+            source.paused = True
+        elif command == 'resume':
+            source.paused = False
+        elif command == 'stop':
+            del self.sources[channel]
+            self._discard(source)
+
+    def _discard(self, source):
+        source.stop_event.set()
+        source.done.set()
+
+    def _notify_finished(self):
+        """Run on_done callbacks away from the output callback"""
+        while True:
+            source = self.finished.get()
+            if source is None:
+                return
+            if source.on_done is not None:
+                try:
+                    source.on_done(source)
+                except Exception as e:
+                    logger.error(f"Error in audio completion callback: {e}")
@@ -0,0 +1,967 @@
+import os
+import json
+import asyncio
+import queue
+import subprocess
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import cv2
+import numpy as np
+from flask import Flask, Response, jsonify, request
+from websockets.server import serve as websocket_serve
+from websockets.exceptions import ConnectionClosed
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Camera settings
+CAMERA_INDEX = 0
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+CAMERA_FPS = 30
+FRAME_RING_SIZE = 8  # Recent frames kept for consumers that fall slightly behind
+STREAM_MAX_FPS = CAMERA_FPS  # Default per-client cap for /stream
+
+# JPEG quality/scale ladder for /stream, best first. Clients are snapped to one
+# of these tiers so viewers on the same tier share the encoded bytes.
+STREAM_TIERS = [(80, 1.0), (70, 0.75), (60, 0.5), (45, 0.5), (35, 0.25)]
+STREAM_SLOW_WRITE = 1.5  # Socket write time, in frame intervals, that counts as falling behind
+STREAM_STEP_DOWN_AFTER = 3  # Consecutive slow writes before dropping a tier
+STREAM_STEP_UP_AFTER = 60  # Consecutive fast writes before trying a better tier
+
+# Video recording settings
+FFMPEG_PATH = "/usr/bin/ffmpeg"
+RECORDING_FPS = CAMERA_FPS
+# ffmpeg video encoder for recordings, e.g. "libx264" or the Pi's hardware
+# "h264_v4l2m2m"; "opencv" skips ffmpeg and uses cv2.VideoWriter with mp4v
+RECORDING_ENCODER = os.environ.get("RECORDING_ENCODER", "libx264")
+RECORDING_PRESET = "ultrafast"  # Only used by the libx264/libx265 encoders
+RECORDING_QUEUE_SIZE = 60  # Frames buffered between capture and encoder (~2 s)
+
+# Optional always-on pre-event buffer, so recordings include the seconds
+# before the trigger. Costs a permanently open camera and a little CPU.
+PRE_EVENT_ENABLED = os.environ.get("PRE_EVENT_BUFFER", "0") == "1"
+PRE_EVENT_SECONDS = float(os.environ.get("PRE_EVENT_SECONDS", "5"))
+PRE_EVENT_MAX_BYTES = int(os.environ.get("PRE_EVENT_MAX_MB", "8")) * 1024 * 1024  # Hard memory cap
+PRE_EVENT_FPS = 10
+PRE_EVENT_TIER = (60, 0.5)  # JPEG quality and scale of buffered frames
+
+# Camera server variables
+CAMERA_SERVER_PORT = 5000
+CAMERA_SERVER_BACKEND = os.environ.get("CAMERA_SERVER_BACKEND", "flask")  # "flask" or "asyncio"
+WEBSOCKET_PORT = 5001  # Binary JPEG push for LAN viewers, see WebSocketFrameServer
+WEBSOCKET_ACK_TIMEOUT = 5  # Seconds to wait for a viewer's ack before checking the connection again
+websocket_server = None
+camera_server = None
+is_streaming = False
+
+
+class FrameBus:
+    """Single capture thread publishing camera frames to any number of consumers.
+
+    Every captured frame goes into a small ring buffer together with a sequence
+    number and a monotonic timestamp. Consumers (preview, recorder, MJPEG clients,
+    motion detection) subscribe by name; the device is opened when the first
+    consumer subscribes and released when the last one unsubscribes. Published
+    frames are shared between consumers and must be treated as read-only.
+    """
+
+    def __init__(self, device=CAMERA_INDEX, width=FRAME_WIDTH, height=FRAME_HEIGHT,
+                 fps=CAMERA_FPS, ring_size=FRAME_RING_SIZE):
+        self.device = device
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.ring = [None] * ring_size  # (seq, timestamp, frame) entries
+        self.seq = 0
+        self.session_seq = 0  # Last seq before the device was most recently opened
+        self.cond = threading.Condition()
+        self.lock = threading.Lock()  # Serializes opening/closing the device
+        self.subscribers = set()
+        self.running = False
+        self.thread = None
+
+    def subscribe(self, name):
+        """Register a consumer, opening the camera if it is the first one"""
+        with self.lock:
+            self.subscribers.add(name)
+            if self.running:
+                return True
+            # Make sure a previous capture thread has released the device
+            if self.thread is not None:
+                self.thread.join(timeout=2)
+                self.thread = None
+            try:
+                capture = cv2.VideoCapture(self.device)
+                if not capture.isOpened():
+                    logger.error("Failed to open camera")
+                    self.subscribers.discard(name)
+                    return False
+
+                # Set camera properties
+                capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+                capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+                capture.set(cv2.CAP_PROP_FPS, self.fps)
+            except Exception as e:
+                logger.error(f"Error initializing camera: {e}")
+                self.subscribers.discard(name)
+                return False
+
+            # Frames from an earlier session may be hours old, never hand them out again
+            with self.cond:
+                self.ring = [None] * len(self.ring)
+                self.session_seq = self.seq
+            self.running = True
+            self.thread = threading.Thread(target=self._capture_loop, args=(capture,))
+            self.thread.daemon = True
+            self.thread.start()
+            logger.info("USB Camera initialized successfully")
+            return True
+
+    def unsubscribe(self, name):
+        """Remove a consumer, releasing the camera once nobody is left"""
+        with self.lock:
+            self.subscribers.discard(name)
+            if self.subscribers or not self.running:
+                return
+            with self.cond:
+                self.running = False
+                self.cond.notify_all()
+            if self.thread is not threading.current_thread():
+                self.thread.join(timeout=2)
+                self.thread = None
+
+    def _capture_loop(self, capture):
+        """Read frames from the device and publish them to the ring buffer"""
+        while self.running:
+            try:
+                ret, current_frame = capture.read()
+            except Exception as e:
+                logger.error(f"Error in camera stream: {e}")
+                ret = False
+            if not ret:
+                logger.warning("Failed to capture frame")
+                time.sleep(0.1)
+                continue
+            with self.cond:
+                self.seq += 1
+                self.ring[self.seq % len(self.ring)] = (self.seq, time.monotonic(), current_frame)
+                self.cond.notify_all()
+        try:
+            capture.release()
+            logger.info("Camera released successfully")
+        except Exception as e:
+            logger.error(f"Error releasing camera: {e}")
+
+    def latest(self):
+        """Return the newest (seq, timestamp, frame) entry, or None"""
+        with self.cond:
+            if self.seq == self.session_seq:
+                return None
+            return self.ring[self.seq % len(self.ring)]
+
+    def wait_for(self, after_seq, timeout=1.0, latest=False):
+        """Block until a frame newer than after_seq is published.
+
+        Returns the next unseen entry still held in the ring (so a recorder sees
+        every frame it can keep up with), or the newest one when latest is True.
+        Returns None on timeout; waiting on a stopped camera sleeps for the
+        full timeout rather than returning straight away.
+        """
+        with self.cond:
+            # Frames from an earlier session do not count as newer
+            self.cond.wait_for(lambda: self.seq > max(after_seq, self.session_seq), timeout)
+            if self.seq <= max(after_seq, self.session_seq):
+                return None
+            if latest:
+                return self.ring[self.seq % len(self.ring)]
+            oldest = max(after_seq + 1, self.seq - len(self.ring) + 1, self.session_seq + 1)
+            return self.ring[oldest % len(self.ring)]
+
+
+class JpegEncoder:
+    """Encodes each published frame to an MJPEG part exactly once per tier.
+
+    The first /stream client that asks for a new sequence number at a given
+    (quality, scale) tier does the resize and cv2.imencode; every other client
+    on that tier gets the same immutable bytes object. Tiers are encoded under
+    their own locks, outside the frame bus lock, so capture is never blocked.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tier_locks = {}
+        self.cache = {}  # (quality, scale) -> (seq, jpeg, part)
+
+    def encode(self, entry, tier=STREAM_TIERS[0]):
+        """Return (seq, MJPEG part) for a (seq, timestamp, frame) bus entry"""
+        cached = self._encode(entry, tier)
+        return None if cached is None else (cached[0], cached[2])
+
+    def encode_jpeg(self, entry, tier=STREAM_TIERS[0]):
+        """Return (seq, bare JPEG bytes) for a (seq, timestamp, frame) bus entry"""
+        cached = self._encode(entry, tier)
+        return None if cached is None else (cached[0], cached[1])
+
+    def _encode(self, entry, tier):
+        seq, _, frame = entry
+        with self.lock:
+            tier_lock = self.tier_locks.setdefault(tier, threading.Lock())
+        with tier_lock:
+            cached = self.cache.get(tier)
+            if cached is not None and cached[0] >= seq:
+                return cached
+            quality, scale = tier
+            if scale != 1.0:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            # Convert frame to JPEG with quality settings
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ret:
+                return None
+            jpeg = buffer.tobytes()
+            cached = (seq, jpeg, b'--frame\r\n'
+                                 b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+            self.cache[tier] = cached
+            return cached
+
+
+class VideoRecorder:
+    """Records frame bus frames to an MP4 file with a two-stage pipeline.
+
+    The capture stage takes every frame from the bus, stamped with its
+    monotonic capture time, and hands it to the encoder stage through a
+    bounded queue; if the encoder falls behind, frames are dropped rather
+    than blocking capture. The encoder stage writes a constant frame rate
+    file by placing each frame at the slot given by its timestamp,
+    repeating the previous frame to fill gaps, so the clip plays back at
+    real speed whatever the actual capture rate was. Frames are piped as
+    raw BGR into an ffmpeg subprocess, or written with cv2.VideoWriter
+    when the encoder is "opencv" or ffmpeg is not available.
+
+    When a running PreEventBuffer is passed in, the clip starts with its
+    buffered frames, upscaled to the live frame size, and duration counts
+    from the moment start() was called.
+
+    When a sink (any object with write(bytes)) is passed in, the encoded
+    MP4 is streamed into it while recording instead of being written to
+    filename, e.g. straight into a Storage upload.
+    """
+
+    def __init__(self, filename, duration=None, fps=RECORDING_FPS, encoder=RECORDING_ENCODER,
+                 subscriber=None, pre_event=None, sink=None):
+        self.filename = filename
+        self.duration = duration
+        self.fps = fps
+        self.encoder = encoder
+        # Each recorder holds the camera under its own name, so one finishing never closes it for another
+        self.subscriber = subscriber or f"recorder-{id(self)}"
+        self.pre_event = pre_event
+        self.sink = sink
+        self.pre_frames = []
+        self.frame_size = None
+        self.trigger_time = None
+        self.start_seq = 0
+        self.frames = None
+        self.stop_event = threading.Event()
+        self.capture_thread = None
+        self.encoder_thread = None
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.error = None
+
+    def start(self):
+        """Subscribe to the camera and start both stages"""
+        self.trigger_time = time.monotonic()
+        if self.pre_event is not None and self.pre_event.running:
+            self.pre_frames = self.pre_event.snapshot()
+        if not frame_bus.subscribe(self.subscriber):
+            return False
+        # Live frames start here; anything already in the ring predates the trigger
+        self.start_seq = frame_bus.seq
+        self.frames = queue.Queue(maxsize=RECORDING_QUEUE_SIZE + len(self.pre_frames))
+        self.capture_thread = threading.Thread(target=self._capture_stage)
+        self.capture_thread.daemon = True
+        self.encoder_thread = threading.Thread(target=self._encoder_stage)
+        self.encoder_thread.daemon = True
+        self.encoder_thread.start()
+        self.capture_thread.start()
+        return True
+
+    def stop(self):
+        """Finish the recording early"""
+        self.stop_event.set()
+
+    def wait(self):
+        """Wait for the file to be finalized; returns True if it was written"""
+        self.capture_thread.join()
+        self.encoder_thread.join()
+        return self.error is None and self.frames_written > 0
+
+    def _capture_stage(self):
+        last_seq = self.start_seq
+        try:
+            while not self.stop_event.is_set():
+                timeout = 1.0
+                if self.duration is not None:
+                    # Stop on time even if the camera stops delivering frames
+                    remaining = self.trigger_time + self.duration - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    timeout = min(timeout, remaining)
+                entry = frame_bus.wait_for(last_seq, timeout=timeout)
+                if entry is None:
+                    continue
+                last_seq, timestamp, frame = entry
+                if timestamp < self.trigger_time:
+                    continue  # The pre-event frames cover the time before the trigger
+                if self.pre_frames:
+                    # Seconds before the trigger go first, as JPEG for the encoder to decode
+                    self.frame_size = (frame.shape[1], frame.shape[0])
+                    for pre_timestamp, jpeg in self.pre_frames:
+                        if pre_timestamp < timestamp:
+                            self.frames.put_nowait((pre_timestamp, jpeg))
+                    self.pre_frames = []
+                if self.duration is not None and timestamp - self.trigger_time >= self.duration:
+                    break
+                try:
+                    self.frames.put_nowait((timestamp, frame))
+                except queue.Full:
+                    self.frames_dropped += 1
+        finally:
+            frame_bus.unsubscribe(self.subscriber)
+            self.frames.put(None)  # Tell the encoder we are done
+            if self.frames_dropped:
+                logger.warning(f"Recorder dropped {self.frames_dropped} frames, encoder too slow")
+
+    def _open_writer(self, width, height):
+        """Return a write(frame) function and a close() function for the output"""
+        if self.encoder != "opencv":
+            command = [FFMPEG_PATH, '-y', '-loglevel', 'error',
+                       '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}',
+                       '-r', str(self.fps), '-i', '-',
+                       '-c:v', self.encoder]
+            if self.encoder.startswith('libx26'):
+                command += ['-preset', RECORDING_PRESET]
+            command += ['-pix_fmt', 'yuv420p']
+            if self.sink is not None:
+                # Fragmented MP4 can be written to a pipe without seeking back
+                command += ['-movflags', 'frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4', 'pipe:1']
+            else:
+                command += ['-movflags', '+faststart', self.filename]
+            try:
+                process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+                                           stdout=subprocess.PIPE if self.sink is not None else None)
+                pump = None
+                if self.sink is not None:
+                    pump = threading.Thread(target=self._pump_output, args=(process.stdout,))
+                    pump.daemon = True
+                    pump.start()
+
+                def close():
+                    process.stdin.close()
+                    if pump is not None:
+                        pump.join()
+                    if process.wait() != 0:
+                        raise RuntimeError(f"ffmpeg failed: {process.stderr.read().decode(errors='replace')}")
+                return lambda frame: process.stdin.write(frame.tobytes()), close
+            except FileNotFoundError:
+                logger.warning("ffmpeg not found, recording with OpenCV instead")
+
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        writer = cv2.VideoWriter(self.filename, fourcc, float(self.fps), (width, height))
+
+        def close():
+            writer.release()
+            if self.sink is not None:
+                # cv2.VideoWriter can only write files, hand the finished file over
+                with open(self.filename, 'rb') as f:
+                    self._pump_output(f)
+                os.remove(self.filename)
+        return writer.write, close
+
+    def _pump_output(self, stream):
+        """Copy encoder output into the sink as it is produced"""
+        while True:
+            data = stream.read(64 * 1024)
+            if not data:
+                break
+            self.sink.write(data)
+
+    def _encoder_stage(self):
+        write = close = None
+        start_time = None
+        previous = None
+        try:
+            while True:
+                item = self.frames.get()
+                if item is None:
+                    break
+                timestamp, frame = item
+                if isinstance(frame, bytes):
+                    # Pre-event frame: decode and scale up to the live size
+                    frame = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_COLOR)
+                    frame = cv2.resize(frame, self.frame_size)
+                if write is None:
+                    height, width = frame.shape[:2]
+                    write, close = self._open_writer(width, height)
+                    start_time = timestamp
+                # Constant frame rate output: fill up to this frame's slot
+                slot = int(round((timestamp - start_time) * self.fps))
+                while self.frames_written < slot and previous is not None:
+                    write(previous)
+                    self.frames_written += 1
+                if self.frames_written <= slot:
+                    write(frame)
+                    self.frames_written += 1
+                previous = frame
+        except Exception as e:
+            self.error = e
+            logger.error(f"Error encoding video: {e}")
+            # Keep draining so the capture stage is never blocked
+            while self.frames.get() is not None:
+                pass
+        finally:
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    self.error = e
+                    logger.error(f"Error finalizing video: {e}")
+
+
+class PreEventBuffer:
+    """Keeps the last few seconds of camera frames as low resolution JPEGs.
+
+    Runs as an ordinary frame bus consumer at a reduced frame rate. Frames are
+    encoded through jpeg_encoder (so they share work with /stream viewers on the
+    same tier) and kept in a deque that is trimmed by age and by total bytes,
+    so memory use never exceeds max_bytes whatever the scene looks like.
+    """
+
+    def __init__(self, seconds=PRE_EVENT_SECONDS, fps=PRE_EVENT_FPS, tier=PRE_EVENT_TIER,
+                 max_bytes=PRE_EVENT_MAX_BYTES):
+        self.seconds = seconds
+        self.fps = fps
+        self.tier = tier
+        self.max_bytes = max_bytes
+        self.frames = deque()  # (timestamp, jpeg) entries, oldest first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Subscribe to the camera and start buffering"""
+        if self.running:
+            return True
+        if not frame_bus.subscribe('pre-event'):
+            return False
+        self.running = True
+        self.thread = threading.Thread(target=self._buffer_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"Pre-event buffer keeping the last {self.seconds:.0f} seconds")
+        return True
+
+    def stop(self):
+        """Stop buffering and release the camera"""
+        if not self.running:
+            return
+        self.running = False
+        self.thread.join(timeout=2)
+        frame_bus.unsubscribe('pre-event')
+        with self.lock:
+            self.frames.clear()
+            self.total_bytes = 0
+
+    def snapshot(self):
+        """Return the buffered (timestamp, jpeg) frames, oldest first"""
+        with self.lock:
+            return list(self.frames)
+
+    def _buffer_loop(self):
+        last_seq = 0
+        last_kept = 0
+        while self.running:
+            entry = frame_bus.wait_for(last_seq, latest=True)
+            if entry is None:
+                continue
+            last_seq, timestamp, _ = entry
+            if timestamp - last_kept < 1.0 / self.fps:
+                continue
+            encoded = jpeg_encoder.encode_jpeg(entry, self.tier)
+            if encoded is None:
+                continue
+            last_kept = timestamp
+            jpeg = encoded[1]
+            with self.lock:
+                self.frames.append((timestamp, jpeg))
+                self.total_bytes += len(jpeg)
+                # Trim by age, then by the memory cap
+                while self.frames and (timestamp - self.frames[0][0] > self.seconds
+                                       or self.total_bytes > self.max_bytes):
+                    self.total_bytes -= len(self.frames.popleft()[1])
+
+
+# Shared capture thread for the whole process
+frame_bus = FrameBus()
+jpeg_encoder = JpegEncoder()
+pre_event_buffer = PreEventBuffer()
+
+
+def init_camera():
+    """Start the shared capture thread for the MJPEG stream"""
+    return frame_bus.subscribe('stream')
+
+def release_camera():
+    """Release the stream's hold on the camera"""
+    global is_streaming
+    is_streaming = False
+    frame_bus.unsubscribe('stream')
+
+def pick_stream_tier(quality, scale):
+    """Index of the best tier that does not exceed the requested quality and scale"""
+    for index, (tier_quality, tier_scale) in enumerate(STREAM_TIERS):
+        if tier_quality <= quality and tier_scale <= scale:
+            return index
+    return len(STREAM_TIERS) - 1
+
+def parse_stream_params(get_arg):
+    """Read the optional quality/scale/fps stream parameters.
+
+    get_arg(name, default, type) looks up a single query parameter.
+    Returns (max_fps, tier_index).
+    """
+    quality = get_arg('quality', STREAM_TIERS[0][0], int)
+    scale = get_arg('scale', STREAM_TIERS[0][1], float)
+    fps = get_arg('fps', STREAM_MAX_FPS, float)
+    fps = min(max(fps, 1), STREAM_MAX_FPS)
+    return fps, pick_stream_tier(quality, scale)
+
+
+def query_arg_getter(query):
+    """Adapt a parse_qs() dict to the get_arg used by parse_stream_params"""
+    def get_arg(name, default, type):
+        try:
+            return type(query[name][0]) if name in query else default
+        except ValueError:
+            return default
+    return get_arg
+
+
+class StreamTierController:
+    """Steps one stream client up and down the STREAM_TIERS ladder.
+
+    The caller reports how long each frame took to write to the client's
+    socket. When writes keep exceeding the frame interval the client is
+    moved to a cheaper tier, and after a long run of fast writes it is moved
+    back up, never above the tier it asked for.
+    """
+
+    def __init__(self, tier_index, max_fps):
+        self.best_index = tier_index
+        self.tier_index = tier_index
+        self.frame_interval = max(1.0 / max_fps, 1.0 / CAMERA_FPS)
+        self.slow_writes = 0
+        self.fast_writes = 0
+
+    @property
+    def tier(self):
+        return STREAM_TIERS[self.tier_index]
+
+    def record_write(self, seconds):
+        """Record the write time of one frame and adjust the tier"""
+        if seconds > self.frame_interval * STREAM_SLOW_WRITE:
+            self.slow_writes += 1
+            self.fast_writes = 0
+            if self.slow_writes >= STREAM_STEP_DOWN_AFTER and self.tier_index < len(STREAM_TIERS) - 1:
+                self.tier_index += 1
+                self.slow_writes = 0
+                logger.info(f"Stream client falling behind, dropping to tier {self.tier}")
+        else:
+            self.fast_writes += 1
+            self.slow_writes = 0
+            if self.fast_writes >= STREAM_STEP_UP_AFTER and self.tier_index > self.best_index:
+                self.tier_index -= 1
+                self.fast_writes = 0
+                logger.info(f"Stream client caught up, raising to tier {self.tier}")
+
+
+def generate_frames(max_fps=STREAM_MAX_FPS, tier_index=0):
+    """Generator function to yield frames for streaming.
+
+    Blocks until the capture thread publishes a newer frame, so an idle
+    camera costs no CPU and every frame is sent at most once per client.
+    The server writes each yielded part before asking for the next one, so
+    the time spent away from the generator is this client's socket write
+    time, which drives the client's tier.
+    """
+    min_interval = 1.0 / max_fps
+    tiers = StreamTierController(tier_index, max_fps)
+    last_seq = 0
+    last_sent = 0
+    while True:
+        # Respect the client's frame rate cap before picking the newest frame
+        delay = last_sent + min_interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        entry = frame_bus.wait_for(last_seq, latest=True)
+        if entry is None:
+            continue
+        encoded = jpeg_encoder.encode(entry, tiers.tier)
+        if encoded is None:
+            last_seq = entry[0]
+            continue
+        last_seq, part = encoded
+        last_sent = time.monotonic()
+        # Yield the shared MJPEG part
+        yield part
+        tiers.record_write(time.monotonic() - last_sent)
+
+# Route handlers shared by the Flask and asyncio servers. Each returns
+# (payload, http_status).
+def handle_start_stream():
+    global is_streaming
+
+    try:
+        if is_streaming:
+            return {"status": "success", "message": "Camera already streaming"}, 200
+
+        if not init_camera():
+            return {"status": "error", "message": "Failed to initialize camera"}, 500
+
+        is_streaming = True
+        logger.info("Camera stream started")
+        return {"status": "success", "message": "Camera stream started"}, 200
+    except Exception as e:
+        logger.error(f"Error starting stream: {e}")
+        return {"status": "error", "message": str(e)}, 500
+
+def handle_stop_stream():
+    try:
+        if not is_streaming:
+            return {"status": "success", "message": "Camera already stopped"}, 200
+
+        release_camera()
+        return {"status": "success", "message": "Camera stream stopped"}, 200
+    except Exception as e:
+        logger.error(f"Error stopping stream: {e}")
+        return {"status": "error", "message": str(e)}, 500
+
+def handle_status():
+    return {
+        "status": "success",
+        "is_streaming": is_streaming,
+        "is_recording": any(name.startswith('recorder-') for name in list(frame_bus.subscribers)),
+        "camera_initialized": frame_bus.running
+    }, 200
+
+CONTROL_ROUTES = {
+    ('POST', '/start-stream'): handle_start_stream,
+    ('POST', '/stop-stream'): handle_stop_stream,
+    ('GET', '/status'): handle_status,
+}
+
+def create_camera_server():
+    """Create the Flask app with the camera control and streaming routes"""
+    app = Flask(__name__)
+
+    @app.route('/')
+    def index():
+        return "USB Camera Streaming Server"
+
+    @app.route('/stream')
+    def video_feed():
+        # Optional ?quality=, ?scale= and ?fps= let slow links ask for less
+        max_fps, tier_index = parse_stream_params(
+            lambda name, default, type: request.args.get(name, default=default, type=type))
+        return Response(generate_frames(max_fps=max_fps, tier_index=tier_index),
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
+
+    def add_control_route(method, path, handler):
+        def view():
+            payload, code = handler()
+            return jsonify(payload), code
+        app.add_url_rule(path, handler.__name__, view, methods=[method])
+
+    for (method, path), handler in CONTROL_ROUTES.items():
+        add_control_route(method, path, handler)
+
+    return app
+
+
+class AsyncFrameLoop:
+    """Runs an asyncio server in a background thread and feeds it frame bus entries.
+
+    One pump thread waits on the frame bus and wakes every coroutine awaiting
+    wait_for_frame() when a new frame is published, so viewers cost no thread
+    of their own. JPEG encoding runs on a small fixed executor and is shared
+    through jpeg_encoder. Subclasses implement _listen() to open the listener.
+    """
+
+    name = "Async frame server"
+
+    def __init__(self, host, port, encode_workers=2):
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=encode_workers)
+        self.loop = None
+        self.thread = None
+        self.pump_thread = None
+        self.running = False
+        self.stop_event = None
+        self.frame_event = None
+        self.latest_entry = None
+        self.client_tasks = set()
+
+    def start(self):
+        """Run the event loop in a background thread"""
+        if self.running:
+            return
+        self.running = True
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_until_complete, args=(self._serve(),))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Close the listener, cancel all viewers and wait for the loop to exit"""
+        if not self.running:
+            return
+        self.running = False
+        self.loop.call_soon_threadsafe(self.stop_event.set)
+        self.thread.join(timeout=5)
+        if self.pump_thread is not None:
+            self.pump_thread.join(timeout=2)
+        self.loop.close()
+        logger.info(f"{self.name} stopped")
+
+    async def _listen(self):
+        raise NotImplementedError
+
+    async def _serve(self):
+        self.stop_event = asyncio.Event()
+        self.frame_event = asyncio.Event()
+        server = await self._listen()
+        self.pump_thread = threading.Thread(target=self._frame_pump)
+        self.pump_thread.daemon = True
+        self.pump_thread.start()
+        logger.info(f"{self.name} started on port {self.port}")
+        try:
+            await self.stop_event.wait()
+        finally:
+            server.close()
+            for task in list(self.client_tasks):
+                task.cancel()
+            await asyncio.gather(*self.client_tasks, return_exceptions=True)
+            await server.wait_closed()
+
+    def _frame_pump(self):
+        """Forward new frame bus entries to the event loop"""
+        last_seq = 0
+        while self.running:
+            entry = frame_bus.wait_for(last_seq, latest=True, timeout=0.5)
+            if entry is not None:
+                last_seq = entry[0]
+                try:
+                    self.loop.call_soon_threadsafe(self._publish, entry)
+                except RuntimeError:
+                    break  # Loop already closed
+
+    def _publish(self, entry):
+        # Wake every viewer waiting on the current event, then arm a fresh one
+        self.latest_entry = entry
+        self.frame_event.set()
+        self.frame_event = asyncio.Event()
+
+    async def wait_for_frame(self, after_seq, min_interval, last_sent):
+        """Wait out the frame rate cap, then for an entry newer than after_seq"""
+        delay = last_sent + min_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        while self.latest_entry is None or self.latest_entry[0] <= after_seq:
+            await self.frame_event.wait()
+        return self.latest_entry
+
+    async def encode(self, method, entry, tier):
+        """Run one of jpeg_encoder's encode methods on the executor"""
+        return await self.loop.run_in_executor(self.executor, method, entry, tier)
+
+
+class AsyncCameraServer(AsyncFrameLoop):
+    """Camera control and MJPEG streaming served from a single asyncio event loop.
+
+    Alternative to the threaded Werkzeug server: every viewer is a coroutine
+    rather than an OS thread. Each viewer awaits drain() after writing a frame,
+    so a slow socket only delays that viewer, which then skips to the newest
+    frame and steps down its tier.
+    """
+
+    name = "Async camera server"
+
+    def __init__(self, host='0.0.0.0', port=CAMERA_SERVER_PORT, encode_workers=2):
+        super().__init__(host, port, encode_workers)
+
+    async def _listen(self):
+        return await asyncio.start_server(self._handle_client, self.host, self.port)
+
+    async def _handle_client(self, reader, writer):
+        task = asyncio.current_task()
+        self.client_tasks.add(task)
+        try:
+            request_head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=10)
+            method, target, _ = request_head.split(b'\r\n', 1)[0].decode('latin-1').split(' ', 2)
+            url = urlsplit(target)
+            if method == 'GET' and url.path == '/stream':
+                await self._stream(writer, parse_qs(url.query))
+            elif method == 'GET' and url.path == '/':
+                await self._respond(writer, 200, b"USB Camera Streaming Server", 'text/html; charset=utf-8')
+            elif (method, url.path) in CONTROL_ROUTES:
+                # Control handlers may open the camera, keep them off the loop
+                payload, code = await self.loop.run_in_executor(None, CONTROL_ROUTES[(method, url.path)])
+                await self._respond(writer, code, json.dumps(payload).encode(), 'application/json')
+            else:
+                await self._respond(writer, 404, b'{"status": "error", "message": "Not found"}', 'application/json')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError):
+            pass  # Malformed or abandoned request
+        except (ConnectionError, asyncio.CancelledError):
+            pass  # Viewer went away or server is shutting down
+        except Exception as e:
+            logger.error(f"Error handling camera server request: {e}")
+        finally:
+            self.client_tasks.discard(task)
+            writer.close()
+
+    async def _respond(self, writer, code, body, content_type):
+        reason = {200: 'OK', 404: 'Not Found', 500: 'Internal Server Error'}.get(code, '')
+        writer.write(f"HTTP/1.1 {code} {reason}\r\n"
+                     f"Content-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def _stream(self, writer, query):
+        max_fps, tier_index = parse_stream_params(query_arg_getter(query))
+        min_interval = 1.0 / max_fps
+        tiers = StreamTierController(tier_index, max_fps)
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: multipart/x-mixed-replace; boundary=frame\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"Connection: close\r\n\r\n")
+        await writer.drain()
+        last_seq = 0
+        last_sent = 0
+        while True:
+            entry = await self.wait_for_frame(last_seq, min_interval, last_sent)
+            encoded = await self.encode(jpeg_encoder.encode, entry, tiers.tier)
+            last_seq = entry[0] if encoded is None else encoded[0]
+            if encoded is None:
+                continue
+            last_sent = time.monotonic()
+            writer.write(encoded[1])
+            # Per-connection backpressure: wait for this socket's buffer to drain
+            await writer.drain()
+            tiers.record_write(time.monotonic() - last_sent)
+
+
+class WebSocketFrameServer(AsyncFrameLoop):
+    """Pushes JPEG frames to WebSocket viewers as binary messages.
+
+    A lower-latency alternative to multipart MJPEG for LAN viewers. Connect to
+    ws://<pi>:5001/ with the same optional quality/scale/fps query parameters
+    as /stream. After each frame the server waits for the viewer to send any
+    message back (an ack) before sending the next one, and then sends the
+    newest frame, dropping everything captured in between. The ack round trip
+    drives the viewer's tier. Viewers that connect with ack=0 get frames at
+    their fps cap without waiting.
+    """
+
+    name = "WebSocket frame server"
+
+    def __init__(self, host='0.0.0.0', port=WEBSOCKET_PORT, encode_workers=2):
+        super().__init__(host, port, encode_workers)
+
+    async def _listen(self):
+        return await websocket_serve(self._handle_viewer, self.host, self.port, compression=None)
+
+    async def _handle_viewer(self, websocket):
+        task = asyncio.current_task()
+        self.client_tasks.add(task)
+        try:
+            get_arg = query_arg_getter(parse_qs(urlsplit(websocket.path).query))
+            max_fps, tier_index = parse_stream_params(get_arg)
+            wants_acks = get_arg('ack', 1, int) != 0
+            min_interval = 1.0 / max_fps
+            tiers = StreamTierController(tier_index, max_fps)
+            last_seq = 0
+            last_sent = 0
+            while True:
+                entry = await self.wait_for_frame(last_seq, min_interval, last_sent)
+                encoded = await self.encode(jpeg_encoder.encode_jpeg, entry, tiers.tier)
+                last_seq = entry[0] if encoded is None else encoded[0]
+                if encoded is None:
+                    continue
+                last_sent = time.monotonic()
+                await websocket.send(encoded[1])
+                if wants_acks:
+                    # Only send again once the viewer says it is ready
+                    while True:
+                        try:
+                            await asyncio.wait_for(websocket.recv(), timeout=WEBSOCKET_ACK_TIMEOUT)
+                            break
+                        except asyncio.TimeoutError:
+                            continue
+                tiers.record_write(time.monotonic() - last_sent)
+        except (ConnectionClosed, asyncio.CancelledError):
+            pass  # Viewer went away or server is shutting down
+        except Exception as e:
+            logger.error(f"Error in WebSocket viewer: {e}")
+        finally:
+            self.client_tasks.discard(task)
+
+
+def start_websocket_server():
+    """Start the WebSocket frame push server next to the HTTP routes"""
+    global websocket_server
+
+    if websocket_server is not None:
+        return
+    try:
+        websocket_server = WebSocketFrameServer()
+        websocket_server.start()
+    except Exception as e:
+        websocket_server = None
+        logger.error(f"Error starting WebSocket frame server: {e}")
+
+def stop_camera_server():
+    """Stop the camera server and release the camera"""
+    global camera_server, websocket_server
+
+    if is_streaming:
+        release_camera()
+    if websocket_server is not None:
+        websocket_server.stop()
+        websocket_server = None
+    if isinstance(camera_server, AsyncCameraServer):
+        camera_server.stop()
+        camera_server = None
+
+
+if __name__ == '__main__':
+    # Standalone server, launched by the GUI's "Launch Flask Server" button
+    start_websocket_server()
+    if CAMERA_SERVER_BACKEND == "asyncio":
+        camera_server = AsyncCameraServer()
+        camera_server.start()
+        try:
+            camera_server.thread.join()
+        except KeyboardInterrupt:
+            stop_camera_server()
+    else:
+        camera_server = create_camera_server()
+        camera_server.run(host='0.0.0.0', port=CAMERA_SERVER_PORT, threaded=True)
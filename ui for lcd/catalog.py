@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Recordings catalog settings
+CATALOG_PATH = os.environ.get("RECORDINGS_CATALOG", "recordings_catalog.db")
+CATALOG_PREFIXES = ('recordings/', 'voice_notes/')  # Storage folders shown in the media player
+
+
+def local_time(timestamp):
+    """Naive local datetime for a Firestore/Storage timestamp, so entries sort together"""
+    if timestamp is None or timestamp.tzinfo is None:
+        return timestamp
+    return datetime.fromtimestamp(timestamp.timestamp())
+
+
+class RecordingsCatalog:
+    """Local index of the recordings shown in the media player.
+
+    Entries are keyed by blob name and remember the blob generation they
+    were last seen at, so the list can be served from memory without
+    touching Storage. The index is persisted to SQLite and kept current by
+    apply_changes(), which takes the change set of a Firestore `recordings`
+    snapshot, and sync_storage(), one listing per folder that picks up blobs
+    added or removed while the device was offline. A blob is only made
+    public the first time a generation of it is found without a download
+    URL; every later refresh is free.
+    """
+
+    def __init__(self, path=CATALOG_PATH, prefixes=CATALOG_PREFIXES):
+        self.prefixes = tuple(prefixes)
+        self.lock = threading.Lock()
+        self.entries = {}  # Recording records by blob name
+        self.ordered = None  # Cached newest-first list, rebuilt after changes
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS recordings (
+                                 blob TEXT PRIMARY KEY,
+                                 generation INTEGER,
+                                 doc_id TEXT,
+                                 name TEXT,
+                                 url TEXT,
+                                 timestamp REAL)""")
+        # Columns added after the first version of the catalog
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(recordings)")]
+        for name, kind in (('gain', 'REAL'), ('codec', 'TEXT')):
+            if name not in columns:
+                self.conn.execute(f"ALTER TABLE recordings ADD COLUMN {name} {kind}")
+        self.conn.commit()
+        for blob, generation, doc_id, name, url, timestamp, gain, codec in self.conn.execute(
+                "SELECT blob, generation, doc_id, name, url, timestamp, gain, codec FROM recordings"):
+            self.entries[blob] = {
+                'id': blob,
+                'generation': generation,
+                'doc_id': doc_id,
+                'name': name,
+                'url': url,
+                'timestamp': datetime.fromtimestamp(timestamp) if timestamp is not None else None,
+                'gain': gain,
+                'codec': codec,
+            }
+        logger.debug(f"Loaded {len(self.entries)} recordings from {path}")
+
+    def recordings(self):
+        """All recordings, newest first; never makes a network call"""
+        with self.lock:
+            if self.ordered is None:
+                self.ordered = sorted(self.entries.values(),
+                                      key=lambda r: r['timestamp'] or datetime.min, reverse=True)
+            return self.ordered
+
+    def apply_changes(self, changes):
+        """Apply a Firestore snapshot change set; returns True if the catalog changed"""
+        updates, removals = [], []
+        with self.lock:
+            for change in changes:
+                doc = change.document
+                if change.type.name == 'REMOVED':
+                    removals += [r for r in self.entries.values() if r['doc_id'] == doc.id]
+                    continue
+                data = doc.to_dict() or {}
+                blob = data.get('storagePath')
+                if not blob or not blob.startswith(self.prefixes):
+                    continue
+                current = self.entries.get(blob)
+                record = {
+                    'id': blob,
+                    'generation': current['generation'] if current else None,
+                    'doc_id': doc.id,
+                    'name': data.get('name') or os.path.basename(blob),
+                    'url': data.get('downloadUrl') or data.get('url') or (current and current['url']),
+                    'timestamp': local_time(data.get('timestamp')) or (current and current['timestamp']),
+                    'gain': data.get('gain'),  # Loudness gain measured at upload, if any
+                    'codec': data.get('codec'),  # Encoding profile codec, if recorded
+                }
+                if record != current:
+                    updates.append(record)
+            return self._commit(updates, removals)
+
+    def sync_storage(self, bucket):
+        """Reconcile with one listing of each Storage folder; returns True if the catalog changed.
+
+        Call it after the first snapshot has been applied, so blobs that
+        already have a document and download URL are not made public.
+        """
+        # Entries added while the listing runs are not in it, only these may be removed
+        with self.lock:
+            known = set(self.entries)
+        blobs = [blob for prefix in self.prefixes for blob in bucket.list_blobs(prefix=prefix)
+                 if not blob.name.endswith('/')]
+        updates = []
+        for blob in blobs:
+            with self.lock:
+                current = self.entries.get(blob.name)
+            if current and current['generation'] == blob.generation:
+                continue
+            url = current['url'] if current else None
+            if url is None or url == blob.public_url:
+                # Only blobs without a download URL need a public ACL, once per generation
+                try:
+                    blob.make_public()
+                    url = blob.public_url
+                except Exception as e:
+                    logger.error(f"Could not make {blob.name} public: {e}")
+                    continue
+            updates.append({
+                'id': blob.name,
+                'generation': blob.generation,
+                'doc_id': current['doc_id'] if current else None,
+                'name': current['name'] if current else os.path.basename(blob.name),
+                'url': url,
+                'timestamp': (current and current['timestamp']) or local_time(blob.time_created),
+                'gain': current['gain'] if current else None,
+                'codec': current['codec'] if current else None,
+            })
+
+        listed = {blob.name for blob in blobs}
+        with self.lock:
+            removals = [r for r in self.entries.values() if r['id'] in known and r['id'] not in listed]
+            return self._commit(updates, removals)
+
+    def _commit(self, updates, removals):
+        """Write changed records to memory and SQLite; called with the lock held"""
+        if not updates and not removals:
+            return False
+        for record in removals:
+            self.entries.pop(record['id'], None)
+        for record in updates:
+            self.entries[record['id']] = record
+        self.ordered = None
+        try:
+            with self.conn:
+                self.conn.executemany("DELETE FROM recordings WHERE blob = ?",
+                                      [(r['id'],) for r in removals])
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO recordings (blob, generation, doc_id, name, url, timestamp, gain, codec) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(r['id'], r['generation'], r['doc_id'], r['name'], r['url'],
+                      r['timestamp'].timestamp() if r['timestamp'] else None, r['gain'], r['codec'])
+                     for r in updates])
+        except Exception as e:
+            logger.error(f"Error saving recordings catalog: {e}")
+        logger.debug(f"Recordings catalog: {len(updates)} updated, {len(removals)} removed")
+        return True
@@ -4,7 +4,6 @@ import datetime
 import os
 import cv2
 import sounddevice as sd
-import soundfile as sf
 from scipy.io.wavfile import write
 import time
 import threading
@@ -14,18 +13,23 @@ from firebase_admin import credentials, storage, firestore
 import logging
 from datetime import datetime, timedelta
 from tkinter import ttk
-import tempfile
 from urllib.request import urlopen
 from PIL import Image, ImageTk
 import io
 import requests
 import io
 import subprocess
+import queue
 from pydub import AudioSegment
 import wave
 import tkcalendar
 from tkcalendar import DateEntry
-import pygame  # For audio playback
+from uploads import StreamingUpload, UploadQueue, UPLOAD_SPOOL_DIR
+from catalog import RecordingsCatalog
+from tasks import TaskScheduler
+from audio import AudioCache, AudioEngine, LoudnessMeter, VoiceProcessor, StreamEncoder, emergency_tone
+from audio import VOICE_PROFILES, VOICE_PROFILE, VoiceActivityDetector, VAD_ENABLED, VAD_SILENCE_TIMEOUT
+from camera_server import frame_bus, VideoRecorder, pre_event_buffer, PRE_EVENT_ENABLED
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -56,10 +60,21 @@ firebase_admin.initialize_app(cred, {
 bucket = storage.bucket()
 db = firestore.client()
 
+# Local index of the recordings in the media player, kept in sync by snapshots
+recordings_catalog = RecordingsCatalog()
+recordings_sync_started = False  # Storage sync runs after the first recordings snapshot
+
+# Decoded voice notes and reminders, so replays start without the network
+audio_cache = AudioCache()
+
+# The one output stream every voice note, reminder and alarm is mixed into
+audio_engine = AudioEngine()
+
 # Global variables
 user_profile_pic_url = None
 user_name = "User"  # Default name
 current_task = None
+current_task_ref = None  # Firestore document of the current task
 task_sent_time = None
 task_due_time = None
 temp_files = []  # List to store temporary files
@@ -68,24 +83,26 @@ snooze_timer = None  # Timer for snooze functionality
 
 # Audio playback variables
 is_playing = False
-playback_thread = None
+playback_source = None  # Voice note Source on the audio engine
 audio_data = None
-sample_rate = 44100
 playback_position = 0
 playback_duration = 0
-playback_stop_event = threading.Event()
+PLAYBACK_JITTER = 0.5  # Seconds decoded ahead before playback starts or after an underrun
+PLAYBACK_SEEK_STEP = 10  # Seconds per seek button press
+
+# Listener-driven redraws
+UI_REFRESH_DELAY = 100  # Milliseconds to gather a burst of snapshot changes into one redraw
+ui_refresh_pending = set()  # Parts of the UI waiting to be redrawn
+ui_refresh_scheduled = False  # An apply_ui_refresh() is queued on the Tk thread
+ui_refresh_lock = threading.Lock()
 
 # Recording state
 is_recording = False
 recording_thread = None
 recording_buffer = []
 
-# Camera server variables
-camera = None
-camera_thread = None
-is_streaming = False
-frame = None
-frame_lock = threading.Lock()
+# Video recording state
+video_recorder = None
 
 # Constants for UI consistency
 STANDARD_FONT = ("DejaVu Sans", 14)  # Increased font size
@@ -113,19 +130,12 @@ STOP_ICON = "⏹"
 EMERGENCY_ICON = "⚠"
 SHUTDOWN_ICON = "⏻"
 
-# Initialize pygame mixer
-pygame.mixer.init()
-
-# Add new global variables
-task_check_thread = None
-stop_task_check = threading.Event()
-
 # Flask Camera Server Control
 flask_server_process = None
 flask_server_running = False
 
 # Audio recording variables
-audio_recording = []
+audio_recording = None  # Queue of raw microphone blocks for the DSP worker
 audio_start_time = None
 
 # --- Smaller button style for 7-inch display ---
@@ -134,143 +144,6 @@ def create_small_button(parent, text, command, bg_color, fg_color="white", width
                      font=("DejaVu Sans", 14, "bold"), width=width, height=1, relief="raised", borderwidth=2,
                      activebackground="#444", activeforeground=fg_color)
 
-# Camera server functions
-def init_camera():
-    """Initialize the USB camera"""
-    global camera
-    try:
-        # Try to open the USB camera (0 is usually the default camera)
-        camera = cv2.VideoCapture(0)
-        if not camera.isOpened():
-            logger.error("Failed to open camera")
-            return False
-        
-        # Set camera properties
-        camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        camera.set(cv2.CAP_PROP_FPS, 30)
-        
-        logger.info("USB Camera initialized successfully")
-        return True
-    except Exception as e:
-        logger.error(f"Error initializing camera: {e}")
-        return False
-
-def release_camera():
-    """Release the camera resources"""
-    global camera, is_streaming
-    is_streaming = False
-    if camera is not None:
-        try:
-            camera.release()
-            logger.info("Camera released successfully")
-        except Exception as e:
-            logger.error(f"Error releasing camera: {e}")
-
-def camera_stream():
-    """Function to capture frames from the camera"""
-    global camera, is_streaming, frame
-    
-    while is_streaming:
-        try:
-            ret, current_frame = camera.read()
-            if ret:
-                with frame_lock:
-                    frame = current_frame.copy()
-            else:
-                logger.warning("Failed to capture frame")
-                time.sleep(0.1)
-        except Exception as e:
-            logger.error(f"Error in camera stream: {e}")
-            time.sleep(0.1)
-
-def generate_frames():
-    """Generator function to yield frames for streaming"""
-    global frame
-    
-    while True:
-        with frame_lock:
-            if frame is not None:
-                # Convert frame to JPEG with quality settings
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                if ret:
-                    # Yield the frame in MJPEG format
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-            else:
-                time.sleep(0.1)
-
-def start_camera_server():
-    """Start the Flask camera server"""
-    global camera_server, is_streaming, camera_thread, flask_server_running
-    
-    if flask_server_running:
-        logger.info("Flask camera server already running.")
-        return True
-    try:
-        if camera_server is None:
-            camera_server = Flask(__name__)
-            
-            @camera_server.route('/')
-            def index():
-                return "USB Camera Recording Server"
-            
-            @camera_server.route('/start-recording', methods=['POST'])
-            def start_recording():
-                global camera, camera_thread, is_streaming
-                
-                try:
-                    if is_streaming:
-                        return jsonify({"status": "error", "message": "Camera already in use"}), 400
-                    
-                    if not init_camera():
-                        return jsonify({"status": "error", "message": "Failed to initialize camera"}), 500
-                    
-                    # Start recording in a separate thread
-                    recording_thread = threading.Thread(target=record_video)
-                    recording_thread.daemon = True
-                    recording_thread.start()
-                    
-                    logger.info("Video recording started")
-                    return jsonify({"status": "success", "message": "Recording started"})
-                except Exception as e:
-                    logger.error(f"Error starting recording: {e}")
-                    return jsonify({"status": "error", "message": str(e)}), 500
-            
-            @camera_server.route('/stop-recording', methods=['POST'])
-            def stop_recording():
-                global is_streaming
-                
-                try:
-                    if not is_streaming:
-                        return jsonify({"status": "success", "message": "No recording in progress"})
-                    
-                    release_camera()
-                    return jsonify({"status": "success", "message": "Recording stopped"})
-                except Exception as e:
-                    logger.error(f"Error stopping recording: {e}")
-                    return jsonify({"status": "error", "message": str(e)}), 500
-            
-            @camera_server.route('/status')
-            def status():
-                return jsonify({
-                    "status": "success",
-                    "is_recording": is_streaming,
-                    "camera_initialized": camera is not None
-                })
-            
-            # Start the Flask server in a separate thread
-            server_thread = threading.Thread(target=lambda: camera_server.run(host='0.0.0.0', port=5000, threaded=True))
-            server_thread.daemon = True
-            server_thread.start()
-            
-            logger.info("Camera server started on port 5000")
-            flask_server_running = True
-            return True
-    except Exception as e:
-        logger.error(f"Error starting camera server: {e}")
-        return False
-
 def show_camera():
     """Show the camera preview window"""
     camera_preview.start_preview()
@@ -318,36 +191,27 @@ def fetch_user_data():
         messagebox.showerror("Error", f"Failed to fetch user data: {e}")
 
 def fetch_current_task():
-    global current_task, task_sent_time, task_due_time
+    global current_task, current_task_ref, task_sent_time, task_due_time
     try:
-        # Get all tasks and filter in memory to avoid index requirement
-        tasks_ref = db.collection('tasks')
-        tasks = tasks_ref.order_by('timestamp', direction=firestore.Query.DESCENDING).get()
-        task_found = False
-        current_time = datetime.now()
-        for task_doc in tasks:
-            task_data = task_doc.to_dict()
-            # Check if task is not completed and is due
-            if not task_data.get('isCompleted', False):
-                scheduled_time = datetime.fromtimestamp(task_data.get('scheduledTime', 0) / 1000)
-                # Only show task if it's time to execute (within 5 minutes of scheduled time)
-                if abs((current_time - scheduled_time).total_seconds()) <= 300:  # 5 minutes = 300 seconds
-                    current_task = task_data.get('task', None)
-                    task_sent_time = task_data.get('sentTime', None)
-                    task_due_time = task_data.get('dueTime', None)
-                    task_found = True
-                    if current_task:
-                        task_text = f"Task: {current_task}\nSent: {task_sent_time}"
-                        if task_due_time:
-                            task_text += f"\nDue: {task_due_time}"
-                        task_display.config(text=task_text)
-                    else:
-                        task_display.config(text="No current task.")
-                    logging.debug(f"Fetched task: {current_task}, {task_sent_time}, {task_due_time}")
-                    break
-        if not task_found:
+        # Pending tasks are kept in memory by the scheduler from the tasks listener
+        task = task_scheduler.current()
+        if task:
+            current_task = task['task']
+            current_task_ref = task['ref']
+            task_sent_time = task['sent_time']
+            task_due_time = task['due_time']
+            if current_task:
+                task_text = f"Task: {current_task}\nSent: {task_sent_time}"
+                if task_due_time:
+                    task_text += f"\nDue: {task_due_time}"
+                task_display.config(text=task_text)
+            else:
+                task_display.config(text="No current task.")
+            logging.debug(f"Fetched task: {current_task}, {task_sent_time}, {task_due_time}")
+        else:
             task_display.config(text="No tasks due at this time.")
             current_task = None
+            current_task_ref = None
             task_sent_time = None
             task_due_time = None
     except Exception as e:
@@ -376,8 +240,13 @@ def emergency_pressed():
         
         db.collection('emergency_notifications').add(emergency_data)
         
-        # Show emergency alert with sound
-        root.bell()  # System beep
+        # Save a clip including the seconds before the button was pressed
+        if pre_event_buffer.running:
+            start_recording()
+        
+        # Show emergency alert with sound, over anything else that is playing
+        if audio_engine.play('emergency', emergency_tone()) is None:
+            logging.error("No audio output for the emergency tone")
         messagebox.showwarning("EMERGENCY", "Emergency alert sent to the app!")
         logging.debug("Emergency notification sent to Firestore")
     except Exception as e:
@@ -409,12 +278,19 @@ def find_usb_microphone():
 
 def start_recording():
     """Start recording video for 10 seconds"""
-    global is_recording, recording_thread, recording_buffer
+    global is_recording, recording_thread, recording_buffer, video_recorder
     try:
-        # Find USB camera
-        if not init_camera():
+        # Start the capture and encoder stages on the shared camera
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"video_{timestamp}.mp4"
+        # Stream the encoder output straight into Firebase Storage
+        video_blob = bucket.blob(f"videos/{filename}")
+        upload = StreamingUpload(video_blob, 'video/mp4', os.path.join(UPLOAD_SPOOL_DIR, filename))
+        recorder = VideoRecorder(filename, duration=10, pre_event=pre_event_buffer, sink=upload)
+        if not recorder.start():
             messagebox.showerror("Recording Error", "No camera found")
             return
+        video_recorder = recorder
 
         # Show recording notification (only for video)
         notification_window = tk.Toplevel(root)
@@ -445,36 +321,18 @@ def start_recording():
         logging.debug("Recording started.")
 
         def record_video():
-            """Record video for 10 seconds"""
-            global camera, is_streaming
+            """Wait for the 10 second clip and finish its upload"""
             try:
-                # Set up video writer
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"video_{timestamp}.mp4"
-                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                out = cv2.VideoWriter(filename, fourcc, 30.0, (640, 480))
-                is_streaming = True
-                start_time = time.time()
-                while is_streaming and (time.time() - start_time) < 10:
-                    ret, frame = camera.read()
-                    if ret:
-                        out.write(frame)
-                        time.sleep(0.033)  # ~30 fps
-                out.release()
-                # Upload to Firebase
-                upload_video_to_firebase(filename)
-                # Clean up
-                if os.path.exists(filename):
-                    os.remove(filename)
+                if not recorder.wait():
+                    logger.error(f"Video recording failed: {recorder.error}")
+                    upload.abort()
+                else:
+                    # The upload queue finishes the upload in the background
+                    upload_queue.submit(upload, 'videos', {'name': filename, 'type': 'video'})
             except Exception as e:
                 logger.error(f"Error recording video: {e}")
-                is_streaming = False
+                upload.abort()
             finally:
-                # Close the camera preview window
-                if camera_preview.window is not None:
-                    camera_preview.stop_preview()
-                # Release camera resources
-                release_camera()
                 # Close notification window
                 notification_window.destroy()
 
@@ -491,64 +349,31 @@ def stop_recording():
     global is_recording
     is_recording = False
     record_voice_btn.config(bg=BUTTON_BG, text="Record Voice")
-    release_camera()
+    if video_recorder is not None:
+        video_recorder.stop()
 
-def upload_video_to_firebase(local_path):
-    try:
-        # Create a unique filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"video_{timestamp}.mp4"
-        
-        logger.debug(f"Attempting to upload video: {local_path}")
-        
-        # Create the blob with the correct path for videos
-        video_blob = bucket.blob(f"videos/{filename}")
-        
-        # Upload the file with content type
-        video_blob.upload_from_filename(
-            local_path,
-            content_type='video/mp4'
-        )
-        
-        # Make the file publicly accessible
-        video_blob.make_public()
-        
-        # Get the public URL
-        public_url = video_blob.public_url
-        
-        # Add metadata to Firestore
-        db.collection('videos').add({
-            'name': filename,
-            'url': public_url,
-            'timestamp': firestore.SERVER_TIMESTAMP,
-            'type': 'video'
-        })
-        
-        messagebox.showinfo("Success", f"Video uploaded successfully!")
-        logger.info(f"Successfully uploaded {filename} to Firebase Storage")
-        
-    except Exception as e:
-        logger.error(f"Upload Error: {e}")
-        messagebox.showerror("Upload Error", f"Failed to upload video: {str(e)}")
+# Finishes recording uploads in the background and survives restarts; it
+# logs each one it publishes, a dialog per upload would pile up on the screen
+upload_queue = UploadQueue(bucket, db)
 
 def task_done():
-    global current_task, task_sent_time, task_due_time
-    if current_task:
+    global current_task, current_task_ref, task_sent_time, task_due_time
+    if current_task_ref:
         try:
-            # Update task status in Firestore
-            tasks_ref = db.collection('tasks')
-            tasks = tasks_ref.where('task', '==', current_task).get()
+            # Update this task's document only, in a single write
+            current_task_ref.update({
+                'isCompleted': True,
+                'completedAt': firestore.SERVER_TIMESTAMP
+            })
             
-            for task_doc in tasks:
-                task_doc.reference.update({
-                    'isCompleted': True,
-                    'completedAt': firestore.SERVER_TIMESTAMP
-                })
+            # Don't wait for the listener to drop it before showing the next task
+            task_scheduler.discard(current_task_ref.id)
             
             messagebox.showinfo("Task Done", "Task marked as done and updated to the app.")
             
             # Clear current task and fetch next task
             current_task = None
+            current_task_ref = None
             task_sent_time = None
             task_due_time = None
             
@@ -562,7 +387,7 @@ def task_done():
         messagebox.showinfo("No Task", "No task to mark as done.")
 
 def add_new_task(task, sent_time, due_time=None):
-    global current_task, task_sent_time, task_due_time
+    global current_task, current_task_ref, task_sent_time, task_due_time
     try:
         # Create task data
         task_data = {
@@ -577,10 +402,11 @@ def add_new_task(task, sent_time, due_time=None):
             task_data['dueTime'] = int(due_time.timestamp() * 1000)
         
         # Add to Firestore
-        db.collection('tasks').add(task_data)
+        _, task_ref = db.collection('tasks').add(task_data)
         
         # Update local variables
         current_task = task
+        current_task_ref = task_ref
         task_sent_time = sent_time
         task_due_time = due_time
         
@@ -607,7 +433,7 @@ def update_task_display():
 def snooze_task():
     global current_task, task_sent_time, task_due_time, snooze_timer
     
-    if current_task:
+    if current_task_ref:
         try:
             # Cancel any existing snooze timer
             if snooze_timer:
@@ -616,16 +442,12 @@ def snooze_task():
             # Create new snooze time (5 minutes from now)
             snooze_time = datetime.now() + timedelta(minutes=5)
             
-            # Update task in Firestore with new due time
-            tasks_ref = db.collection('tasks')
-            tasks = tasks_ref.where('task', '==', current_task).get()
-            
-            for task_doc in tasks:
-                task_doc.reference.update({
-                    'dueTime': int(snooze_time.timestamp() * 1000),
-                    'snoozed': True,
-                    'snoozeCount': firestore.Increment(1)
-                })
+            # Update this task's due time in Firestore, in a single write
+            current_task_ref.update({
+                'dueTime': int(snooze_time.timestamp() * 1000),
+                'snoozed': True,
+                'snoozeCount': firestore.Increment(1)
+            })
             
             # Update local variables
             task_due_time = snooze_time
@@ -653,81 +475,28 @@ def open_task_scheduler():
     pass  # Removed task adding functionality
 
 def fetch_recordings():
-    try:
-        # Get recordings from Firebase Storage (only from recordings folder)
-        recordings_ref = bucket.list_blobs(prefix='recordings/')
-        
-        recordings_list = []
-        for blob in recordings_ref:
-            # Skip if it's a directory or not in recordings folder
-            if not blob.name.endswith('/'):
-                # Get the public URL
-                blob.make_public()
-            recordings_list.append({
-                    'id': blob.name,
-                    'name': os.path.basename(blob.name),
-                    'url': blob.public_url,
-                    'timestamp': blob.time_created
-                })
-        
-        # Sort recordings by timestamp (newest first)
-        recordings_list.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-        logging.debug(f"Fetched recordings: {len(recordings_list)}")
-        return recordings_list
-    except Exception as e:
-        logging.error(f"Error fetching recordings: {e}")
-        return []
+    """Recordings for the media player, newest first, served from the local catalog"""
+    recordings_list = recordings_catalog.recordings()
+    logging.debug(f"Fetched recordings: {len(recordings_list)}")
+    return recordings_list
 
-def convert_mp3_to_wav(mp3_path):
-    """Convert MP3 to WAV using ffmpeg directly on Raspberry Pi"""
-    wav_path = mp3_path.replace(".mp3", ".wav")
+def sync_recordings_catalog():
+    """Reconcile the catalog with Storage once, picking up changes made while offline"""
     try:
-        # Use ffmpeg directly on Raspberry Pi
-        subprocess.run([
-            "/usr/bin/ffmpeg",
-            '-i', mp3_path,
-            '-acodec', 'pcm_s16le',
-            '-ar', '44100',
-            '-ac', '1',
-            wav_path
-        ], check=True, capture_output=True)
-        return wav_path
-    except subprocess.CalledProcessError as e:
-        logging.error(f"FFmpeg conversion error: {e.stderr.decode()}")
-        raise
+        if recordings_catalog.sync_storage(bucket):
+            request_ui_refresh('recordings')
     except Exception as e:
-        logging.error(f"Conversion error: {e}")
-        raise
+        logging.error(f"Error syncing recordings catalog: {e}")
 
 def get_selected_recording():
     """Get the currently selected recording from the listbox"""
-    try:
-        selection = media_listbox.curselection()
-        if not selection:
-            messagebox.showinfo("Selection Error", "Please select a recording to play")
-            return None
-            
-        # Get the selected item text
-        selected_text = media_listbox.get(selection[0])
-        
-        # Fetch recordings to get the full data
-        recordings = fetch_recordings()
-        if not recordings:
-            return None
-            
-        # Find the matching recording
-        for recording in recordings:
-            if recording['name'] in selected_text:
-                return recording
-                
-        return None
-    except Exception as e:
-        logging.error(f"Error getting selected recording: {e}")
-        return None
+    recording = media_list.selected()
+    if recording is None:
+        messagebox.showinfo("Selection Error", "Please select a recording to play")
+    return recording
 
 def play_recording(recording):
-    global is_playing, playback_thread, audio_data, sample_rate, playback_position, playback_duration, playback_stop_event
+    global is_playing, playback_source, audio_data, playback_position, playback_duration
     try:
         if not recording or 'url' not in recording:
             messagebox.showerror("Playback Error", "Invalid recording data")
@@ -744,129 +513,50 @@ def play_recording(recording):
         # Stop any current playback
         stop_playback()
         
-        # Download the file using requests
-        response = requests.get(download_url, stream=True)
-        if response.status_code != 200:
-            messagebox.showerror("Playback Error", f"Failed to download audio: HTTP {response.status_code}")
+        # Decoded audio comes from the local cache; on a miss it is decoded while it downloads
+        try:
+            audio_data = audio_cache.open(download_url, codec=recording.get('codec'))
+        except requests.HTTPError as e:
+            messagebox.showerror("Playback Error", f"Failed to download audio: HTTP {e.response.status_code}")
             return
-            
-        # Create a temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-        temp_path = temp_file.name
-        temp_file.close()
-        
-        logging.debug(f"Saving downloaded file to: {temp_path}")
-        
-        # Save the downloaded content to the temporary file
-        with open(temp_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
         
         try:
-            logging.debug("Converting MP3 to WAV...")
-            # Convert MP3 to WAV using our helper function
-            wav_path = convert_mp3_to_wav(temp_path)
-            
-            logging.debug("Reading WAV file...")
-            # Read the WAV file
-            audio_data, sample_rate = sf.read(wav_path)
-            
-            logging.debug(f"Audio data shape: {audio_data.shape}, Sample rate: {sample_rate}")
-            logging.debug(f"Audio data type: {audio_data.dtype}")
-            
-            # Convert to float32 if needed
-            if audio_data.dtype != np.float32:
-                audio_data = audio_data.astype(np.float32)
-            
-            # If stereo, convert to mono
-            if len(audio_data.shape) > 1:
-                logging.debug("Converting stereo to mono")
-                audio_data = audio_data.mean(axis=1)
-            
-            # Normalize audio
-            max_val = np.max(np.abs(audio_data))
-            if max_val > 0:
-                audio_data = audio_data / max_val
-            
-            playback_duration = len(audio_data) / sample_rate
+            playback_duration = audio_data.duration
             playback_position = 0
             
-            logging.debug(f"Audio duration: {playback_duration:.2f} seconds")
+            logging.debug(f"Audio duration so far: {playback_duration:.2f} seconds")
             
-            # Start playback in a separate thread
-            playback_stop_event.clear()
-            playback_thread = threading.Thread(target=playback_audio, args=(audio_data, sample_rate))
-            playback_thread.daemon = True
-            playback_thread.start()
+            # Play on the voice channel; the loudness gain comes from the recording's
+            # metadata, or from the cache if it has already measured the clip
+            playback_source = audio_engine.play('voice', audio_data, gain=recording.get('gain'),
+                                                prebuffer=int(PLAYBACK_JITTER * audio_data.rate),
+                                                on_done=playback_finished)
+            if playback_source is None:
+                messagebox.showerror("Playback Error", "No audio output device available")
+                return
             
             is_playing = True
             update_playback_status()
             
-            # Add to temp files for cleanup
-            temp_files.append(temp_path)
-            temp_files.append(wav_path)
-            
-            logging.debug(f"Started playback thread for: {recording['name']}")
+            logging.debug(f"Started playback for: {recording['name']}")
             
         except Exception as e:
-            logging.error(f"Error converting or playing audio: {str(e)}", exc_info=True)
+            logging.error(f"Error playing audio: {str(e)}", exc_info=True)
             messagebox.showerror("Playback Error", f"Failed to play recording: {str(e)}")
             
     except Exception as e:
         logging.error(f"Playback Error: {str(e)}", exc_info=True)
         messagebox.showerror("Playback Error", f"Failed to play recording: {str(e)}")
 
-def playback_audio(audio_data, sample_rate):
-    """Play audio data through the sound device"""
-    global playback_position, is_playing
-    
-    try:
-        logging.debug(f"Setting up audio stream with sample rate: {sample_rate}")
-        # Get default output device info
-        device_info = sd.query_devices(kind='output')
-        logging.debug(f"Using output device: {device_info['name']}")
-        
-        # Set up the audio stream
-        with sd.OutputStream(samplerate=sample_rate, channels=1, dtype=np.float32) as stream:
-            logging.debug("Audio stream opened successfully")
-            # Calculate chunk size (100ms of audio)
-            chunk_size = int(sample_rate * 0.1)
-            
-            # Play audio in chunks
-            for i in range(0, len(audio_data), chunk_size):
-                if playback_stop_event.is_set():
-                    logging.debug("Playback stopped by user")
-                    break
-                
-                # Get the current chunk
-                chunk_end = min(i + chunk_size, len(audio_data))
-                chunk = audio_data[i:chunk_end]
-                
-                try:
-                    # Write the chunk to the stream
-                    stream.write(chunk)
-                    # Update position
-                    playback_position = i / sample_rate
-                except Exception as e:
-                    logging.error(f"Error writing to audio stream: {str(e)}", exc_info=True)
-                    break
-            
-            # Ensure the stream is drained
-            stream.stop()
-            logging.debug("Audio stream closed")
-        
-        # Playback completed
-        is_playing = False
-        playback_position = 0
-        update_playback_status()
-        logging.debug("Playback completed successfully")
-        
-    except Exception as e:
-        logging.error(f"Error during playback: {str(e)}", exc_info=True)
-        is_playing = False
-        update_playback_status()
-        messagebox.showerror("Playback Error", f"Error during playback: {str(e)}")
+def playback_finished(source):
+    """Called by the audio engine when a voice note has played to the end"""
+    global is_playing, playback_position
+    if source is not playback_source:
+        return
+    is_playing = False
+    playback_position = 0
+    update_playback_status()
+    logging.debug("Playback completed successfully")
 
 def update_playback_status():
     """Update the state of playback control buttons"""
@@ -889,10 +579,12 @@ def update_playback_status():
 
 def pause_recording():
     """Pause the current playback"""
-    global is_playing
+    global is_playing, playback_position
     try:
         if is_playing:
-            playback_stop_event.set()
+            # The engine keeps the source and its buffered samples, it just stops reading them
+            audio_engine.pause('voice')
+            playback_position = playback_source.position / playback_source.audio.rate
             is_playing = False
             update_playback_status()
             logging.debug("Playback paused")
@@ -904,19 +596,22 @@ def pause_recording():
 
 def resume_recording():
     """Resume playback from where it was paused"""
-    global is_playing, playback_thread, playback_position
+    global is_playing, playback_source
     try:
         if not is_playing and audio_data is not None:
             logging.debug(f"Resuming playback from position: {playback_position:.2f} seconds")
-            # Calculate the remaining audio
-            start_sample = int(playback_position * sample_rate)
-            remaining_audio = audio_data[start_sample:]
-            
-            # Start playback from where we left off
-            playback_stop_event.clear()
-            playback_thread = threading.Thread(target=playback_audio, args=(remaining_audio, sample_rate))
-            playback_thread.daemon = True
-            playback_thread.start()
+            if playback_source is not None and audio_engine.source('voice') is playback_source:
+                audio_engine.resume('voice')
+            else:
+                # The paused source was replaced, start over from the same position
+                gain = playback_source.gain if playback_source is not None else None
+                playback_source = audio_engine.play('voice', audio_data, gain=gain,
+                                                    start=int(playback_position * audio_data.rate),
+                                                    prebuffer=int(PLAYBACK_JITTER * audio_data.rate),
+                                                    on_done=playback_finished)
+                if playback_source is None:
+                    messagebox.showerror("Resume Error", "No audio output device available")
+                    return
             
             is_playing = True
             update_playback_status()
@@ -928,13 +623,28 @@ def resume_recording():
         logging.error(f"Resume Error: {str(e)}", exc_info=True)
         messagebox.showerror("Resume Error", f"Failed to resume playback: {str(e)}")
 
+def seek_playback(offset):
+    """Jump offset seconds, within the part of the clip that is already buffered"""
+    global playback_position
+    try:
+        if playback_source is None or (not is_playing and playback_position == 0):
+            return
+        position = playback_source.position / audio_data.rate
+        target = min(max(0.0, position + offset), audio_data.duration)
+        audio_engine.seek('voice', target)
+        if not is_playing:
+            playback_position = target
+        logging.debug(f"Seeking to {target:.2f} seconds")
+    except Exception as e:
+        logging.error(f"Seek Error: {e}")
+
 def stop_playback():
     """Stop the current playback"""
-    global is_playing, playback_position
+    global is_playing, playback_position, playback_source
     try:
         logging.debug("Stopping playback...")
-        playback_stop_event.set()
-        sd.stop()  # Stop any ongoing playback
+        audio_engine.stop('voice')
+        playback_source = None
         is_playing = False
         playback_position = 0
         update_playback_status()
@@ -942,24 +652,55 @@ def stop_playback():
     except Exception as e:
         logging.error(f"Error stopping playback: {str(e)}", exc_info=True)
 
-def update_media_player():
-    recordings = fetch_recordings()
-    if recordings:
-        media_listbox.delete(0, tk.END)
-        for recording in recordings:
-            # Format the timestamp for display
-            timestamp = recording.get('timestamp')
-            if timestamp:
-                if isinstance(timestamp, datetime):
-                    formatted_time = timestamp.strftime('%Y-%m-%d %H:%M')
-                else:
-                    formatted_time = str(timestamp)
-                display_text = f"{recording['name']} ({formatted_time})"
+class MediaListModel:
+    """Keeps the media listbox and the recordings behind its rows in step.
+
+    rows[i] is the recording shown on listbox row i, so a selection maps
+    back to its recording without searching or refetching the list.
+    """
+    def __init__(self, listbox):
+        self.listbox = listbox
+        self.rows = []
+        
+    def refresh(self, recordings):
+        """Redraw the listbox from recordings, keeping the selected recording selected"""
+        if recordings == self.rows and self.listbox.size() > 0:
+            return
+        selected = self.selected()
+        self.rows = list(recordings)
+        self.listbox.delete(0, tk.END)
+        if not self.rows:
+            self.listbox.insert(tk.END, "No recordings available.")
+            return
+        self.listbox.insert(tk.END, *[self.display_text(recording) for recording in self.rows])
+        if selected is not None:
+            for index, recording in enumerate(self.rows):
+                if recording['id'] == selected['id']:
+                    self.listbox.selection_set(index)
+                    self.listbox.see(index)
+                    break
+            
+    def selected(self):
+        """The recording on the selected row, or None"""
+        selection = self.listbox.curselection()
+        if not selection or selection[0] >= len(self.rows):
+            return None
+        return self.rows[selection[0]]
+        
+    @staticmethod
+    def display_text(recording):
+        # Format the timestamp for display
+        timestamp = recording.get('timestamp')
+        if timestamp:
+            if isinstance(timestamp, datetime):
+                formatted_time = timestamp.strftime('%Y-%m-%d %H:%M')
             else:
-                display_text = recording['name']
-            media_listbox.insert(tk.END, display_text)
-    else:
-        media_listbox.insert(tk.END, "No recordings available.")
+                formatted_time = str(timestamp)
+            return f"{recording['name']} ({formatted_time})"
+        return recording['name']
+
+def update_media_player():
+    media_list.refresh(fetch_recordings())
 
 def cleanup_temp_files():
     global temp_files
@@ -974,30 +715,34 @@ def cleanup_temp_files():
 def setup_realtime_listeners():
     # Listen for user profile changes
     def on_user_snapshot(doc_snapshot, changes, read_time):
-        for doc in doc_snapshot:
-            if doc.exists:
-                user_data = doc.to_dict()
-                update_profile(user_data)
+        # Only documents that were added or modified carry a new profile
+        for change in changes:
+            if change.type.name != 'REMOVED':
+                update_profile(change.document.to_dict())
 
     # Listen for task changes
     def on_task_snapshot(doc_snapshot, changes, read_time):
-        for doc in doc_snapshot:
-            if doc.exists:
-                task_data = doc.to_dict()
-                update_task(task_data)
+        # The scheduler keeps the pending tasks and their wake-ups from the deltas
+        if task_scheduler.apply_changes(changes):
+            request_ui_refresh('task')
 
     # Listen for recording changes
     def on_recording_snapshot(doc_snapshot, changes, read_time):
-        for doc in doc_snapshot:
-            if doc.exists:
-                recording_data = doc.to_dict()
-                update_recordings()
+        global recordings_sync_started
+        # Only redraw the list when the change set touched the catalog
+        if recordings_catalog.apply_changes(changes):
+            request_ui_refresh('recordings')
+        # Reconcile with Storage once the documents are known, so blobs with a download URL stay private
+        if not recordings_sync_started:
+            recordings_sync_started = True
+            threading.Thread(target=sync_recordings_catalog, daemon=True).start()
 
     # Set up the listeners
     user_ref = db.collection('users').document('3Vh88LDtQCeWWwMqCoOM01iqRKA3')
     user_ref.on_snapshot(on_user_snapshot)
 
-    tasks_ref = db.collection('tasks')
+    # Only incomplete tasks; completing one arrives as a REMOVED change
+    tasks_ref = db.collection('tasks').where('isCompleted', '==', False)
     tasks_ref.on_snapshot(on_task_snapshot)
 
     recordings_ref = db.collection('recordings')
@@ -1030,117 +775,80 @@ def update_profile(user_data):
     except Exception as e:
         logging.error(f"Error updating profile: {e}")
 
-def update_task(task_data):
-    global current_task, task_sent_time, task_due_time
+def update_recordings():
     try:
-        # Only update if the task is not completed
-        if not task_data.get('isCompleted', False):
-            current_task = task_data.get('task')
-            task_sent_time = task_data.get('sentTime')
-            task_due_time = task_data.get('dueTime')
-            
-            if current_task:
-                task_text = f"Task: {current_task}\nSent: {task_sent_time}"
-                if task_due_time:
-                    task_text += f"\nDue: {task_due_time}"
-                task_display.config(text=task_text)
-            else:
-                task_display.config(text="No current task.")
-                current_task = None
-                task_sent_time = None
-                task_due_time = None
+        media_list.refresh(fetch_recordings())
     except Exception as e:
-        logging.error(f"Error updating task: {e}")
+        logging.error(f"Error updating recordings: {e}")
 
-def update_recordings():
+def request_ui_refresh(*parts):
+    """Redraw parts of the UI ('task', 'recordings') once on the Tk thread, however many changes arrive"""
+    global ui_refresh_scheduled
+    with ui_refresh_lock:
+        ui_refresh_pending.update(parts)
+        if ui_refresh_scheduled:
+            return
+        ui_refresh_scheduled = True
     try:
-        recordings = fetch_recordings()
-        media_listbox.delete(0, tk.END)
-        if recordings:
-            for recording in recordings:
-                media_listbox.insert(tk.END, recording['name'])
-        else:
-            media_listbox.insert(tk.END, "No recordings available.")
+        root.after(UI_REFRESH_DELAY, apply_ui_refresh)
     except Exception as e:
-        logging.error(f"Error updating recordings: {e}")
+        # Tk is not running yet or any more: keep the parts and let the next request try again
+        logging.warning(f"Could not schedule UI refresh: {e}")
+        with ui_refresh_lock:
+            ui_refresh_scheduled = False
+
+def apply_ui_refresh():
+    global ui_refresh_scheduled
+    with ui_refresh_lock:
+        parts = set(ui_refresh_pending)
+        ui_refresh_pending.clear()
+        ui_refresh_scheduled = False
+    if not parts:
+        return
+    logging.debug(f"Refreshing UI: {', '.join(sorted(parts))}")
+    if 'task' in parts:
+        fetch_current_task()
+    if 'recordings' in parts:
+        update_recordings()
 
 def play_task_audio(audio_url):
     try:
-        # Download the audio file
-        response = requests.get(audio_url)
-        if response.status_code == 200:
-            # Save to temporary file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-            temp_path = temp_file.name
-            temp_file.close()
-            
-            with open(temp_path, 'wb') as f:
-                f.write(response.content)
-            
-            # Convert to WAV for pygame
-            wav_path = convert_mp3_to_wav(temp_path)
-            
-            # Play the audio
-            pygame.mixer.music.load(wav_path)
-            pygame.mixer.music.play()
-            
-            # Wait for audio to finish
-            while pygame.mixer.music.get_busy():
-                pygame.time.Clock().tick(10)
-            
-            # Cleanup
-            os.remove(temp_path)
-            os.remove(wav_path)
+        # Get the decoded audio, from the cache when this reminder has played before
+        audio = audio_cache.open(audio_url)
+        
+        # Reminders duck any voice note that is playing; wait for it to finish
+        source = audio_engine.play('reminder', audio)
+        if source is None:
+            logging.error(f"No audio output, reminder {audio_url} not played")
+            return
+        source.done.wait()
             
     except Exception as e:
         logging.error(f"Error playing task audio: {e}")
 
-def check_scheduled_tasks():
-    while not stop_task_check.is_set():
-        try:
-            current_time = datetime.now()
-            tasks_ref = db.collection('tasks')
-            tasks = tasks_ref.where('isCompleted', '==', False).get()
-            
-            for task_doc in tasks:
-                task_data = task_doc.to_dict()
-                scheduled_time = datetime.fromtimestamp(task_data.get('scheduledTime', 0) / 1000)
-                
-                # Check if it's time to play the audio
-                if (current_time - scheduled_time).total_seconds() < 5 and \
-                   (current_time - scheduled_time).total_seconds() > 0:
-                    # Check if task has audio
-                    if 'recordingUrl' in task_data:
-                        # Play audio in a separate thread
-                        audio_thread = threading.Thread(
-                            target=play_task_audio,
-                            args=(task_data['recordingUrl'],)
-                        )
-                        audio_thread.daemon = True
-                        audio_thread.start()
-            
-            # Update task display
-            fetch_current_task()
-            
-            # Sleep for a short time before next check
-            time.sleep(1)
-            
-        except Exception as e:
-            logging.error(f"Error checking scheduled tasks: {e}")
-            time.sleep(5)  # Sleep longer on error
+def task_reminder_due(task):
+    """Play a task's reminder recording when the scheduler says it is due"""
+    if task['recording_url']:
+        # Play audio in a separate thread
+        audio_thread = threading.Thread(
+            target=play_task_audio,
+            args=(task['recording_url'],)
+        )
+        audio_thread.daemon = True
+        audio_thread.start()
+
+def refresh_current_task():
+    """Redraw the current task on the Tk thread"""
+    request_ui_refresh('task')
+
+# Fires reminders and updates the current task from memory, without polling Firestore
+task_scheduler = TaskScheduler(on_due=task_reminder_due, on_refresh=refresh_current_task)
 
 def start_task_checker():
-    global task_check_thread
-    if task_check_thread is None or not task_check_thread.is_alive():
-        stop_task_check.clear()
-        task_check_thread = threading.Thread(target=check_scheduled_tasks)
-        task_check_thread.daemon = True
-        task_check_thread.start()
+    task_scheduler.start()
 
 def stop_task_checker():
-    stop_task_check.set()
-    if task_check_thread:
-        task_check_thread.join(timeout=1)
+    task_scheduler.stop()
 
 def upload_ngrok_url_to_firebase():
     print("Starting ngrok URL upload...")
@@ -1181,12 +889,17 @@ def toggle_flask_server():
 class CameraPreviewWindow:
     def __init__(self):
         self.window = None
-        self.camera = None
         self.is_running = False
         self.preview_label = None
+        self.last_seq = 0
         
     def start_preview(self):
         if self.window is None:
+            # Subscribe to the shared camera capture
+            if not frame_bus.subscribe('preview'):
+                messagebox.showerror("Camera Error", "No camera found")
+                return
+
             self.window = tk.Toplevel(root)
             self.window.title("Camera Preview")
             self.window.geometry("640x480")
@@ -1199,18 +912,16 @@ class CameraPreviewWindow:
             self.preview_label = tk.Label(self.window)
             self.preview_label.pack(expand=True, fill='both')
             
-            # Initialize camera
-            self.camera = cv2.VideoCapture(0)
-            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            
             self.is_running = True
+            self.last_seq = 0
             self.update_preview()
             
     def update_preview(self):
-        if self.is_running and self.camera is not None:
-            ret, frame = self.camera.read()
-            if ret:
+        if self.is_running:
+            entry = frame_bus.latest()
+            # Only redraw when the capture thread has published a new frame
+            if entry is not None and entry[0] != self.last_seq:
+                self.last_seq, _, frame = entry
                 # Convert frame to RGB
                 frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 # Convert to PhotoImage
@@ -1223,10 +934,9 @@ class CameraPreviewWindow:
             self.window.after(10, self.update_preview)
             
     def stop_preview(self):
-        self.is_running = False
-        if self.camera is not None:
-            self.camera.release()
-            self.camera = None
+        if self.is_running:
+            self.is_running = False
+            frame_bus.unsubscribe('preview')
         if self.window is not None:
             self.window.destroy()
             self.window = None
@@ -1254,89 +964,101 @@ def toggle_record_voice():
             record_voice_btn.config(bg="red", fg="white", text="Stop Recording")
             logging.debug("Voice recording started.")
 
-            # Start audio recording with improved settings
+            # Record at the microphone's own rate; the encoder resamples to the profile's rate
             audio_start_time = datetime.now()
-            sample_rate = 48000  # Increased sample rate for better quality
-            audio_recording = []
+            sample_rate = int(sd.query_devices(mic_index, 'input')['default_samplerate'])
+            audio_recording = queue.Queue()
+            recording_queue = audio_recording
+
+            # Encode with ffmpeg while recording and stream it straight into Firebase Storage
+            profile = VOICE_PROFILES[VOICE_PROFILE]
+            timestamp = audio_start_time.strftime("%Y%m%d_%H%M%S")
+            filename = f"audio_{timestamp}.{profile['extension']}"
+            audio_blob = bucket.blob(f"voice_notes/{filename}")
+            upload = StreamingUpload(audio_blob, profile['content_type'], os.path.join(UPLOAD_SPOOL_DIR, filename))
+            encoder = StreamEncoder(profile['args'], sample_rate, upload)
+            processor = VoiceProcessor(sample_rate)
+            meter = LoudnessMeter(sample_rate)
+            vad = VoiceActivityDetector(sample_rate) if VAD_ENABLED else None
 
             def callback(indata, frames, time_info, status):
                 if is_recording:
-                    # Apply basic noise reduction by removing DC offset and normalizing
-                    audio = indata.copy()
-                    # Remove DC offset
-                    audio = audio - np.mean(audio)
-                    # Normalize to prevent clipping
-                    max_val = np.max(np.abs(audio))
-                    if max_val > 0:
-                        audio = audio / max_val * 0.9  # Leave some headroom
-                    audio_recording.append(audio)
+                    # Hand the raw block to the DSP worker, nothing else happens on the audio thread
+                    recording_queue.put(indata[:, 0].copy())
                 else:
                     raise sd.CallbackStop()
 
+            def process_audio():
+                """Clean each block and feed whatever holds speech to the encoder as it arrives"""
+                while True:
+                    block = recording_queue.get()
+                    if block is None:
+                        return
+                    block = processor.process(block)
+                    if vad is not None:
+                        block = vad.process(block)
+                        if not len(block):
+                            continue
+                    meter.add(block)
+                    encoder.write(block)
+
             # Start the stream in a thread so the GUI doesn't freeze
             def record_audio_stream():
-                # Configure input stream with better settings
-                with sd.InputStream(
-                    samplerate=sample_rate,
-                    channels=1,
-                    callback=callback,
-                    blocksize=2048,  # Increased block size for better stability
-                    dtype=np.float32,
-                    device=mic_index
-                ) as stream:
-                    while is_recording:
-                        time.sleep(0.1)
-
-                # Save the recording
-                timestamp = audio_start_time.strftime("%Y%m%d_%H%M%S")
-                temp_wav = f"temp_{timestamp}.wav"
-                temp_mp3 = f"audio_{timestamp}.mp3"
-                
-                # First save as WAV
-                audio_data = np.concatenate(audio_recording, axis=0)
-                
-                # Apply additional noise reduction
-                # Remove DC offset
-                audio_data = audio_data - np.mean(audio_data)
-                
-                # Apply a simple noise gate
-                noise_floor = 0.01  # Adjust this value based on your noise level
-                audio_data[np.abs(audio_data) < noise_floor] = 0
-                
-                # Normalize the audio
-                max_val = np.max(np.abs(audio_data))
-                if max_val > 0:
-                    audio_data = audio_data / max_val * 0.9  # Leave some headroom
-                
-                # Save the processed audio
-                sf.write(temp_wav, audio_data, sample_rate)
-                
+                global is_recording
                 try:
-                    # Convert WAV to MP3 using ffmpeg with improved settings
-                    subprocess.run([
-                        "/usr/bin/ffmpeg",
-                        '-i', temp_wav,
-                        '-codec:a', 'libmp3lame',
-                        '-qscale:a', '0',  # Highest quality MP3
-                        '-ar', '48000',    # Maintain high sample rate
-                        '-af', 'highpass=f=200,lowpass=f=3000',  # Basic EQ to focus on voice frequencies
-                        temp_mp3
-                    ], check=True, capture_output=True)
+                    worker = threading.Thread(target=process_audio, daemon=True)
+                    worker.start()
+                    # Configure input stream with better settings
+                    with sd.InputStream(
+                        samplerate=sample_rate,
+                        channels=1,
+                        callback=callback,
+                        blocksize=2048,  # Increased block size for better stability
+                        dtype=np.float32,
+                        device=mic_index
+                    ) as stream:
+                        while is_recording:
+                            time.sleep(0.1)
+                            # Stop on our own when nobody has spoken for a while
+                            if vad is not None and VAD_SILENCE_TIMEOUT and vad.silence > VAD_SILENCE_TIMEOUT:
+                                logging.info(f"No speech for {VAD_SILENCE_TIMEOUT}s, stopping voice recording")
+                                is_recording = False
+                    
+                    # Everything but the last few blocks is already encoded and uploading
+                    recording_queue.put(None)
+                    worker.join()
+                    
+                    if vad is not None:
+                        logging.info(f"Voice recording speech ratio: {vad.speech_ratio():.0%}")
+                        if not vad.heard_speech:
+                            logging.info("No speech in voice recording, discarding it")
+                            encoder.abort()
+                            upload.abort()
+                            return
+                    encoder.close()
                     
-                    # Upload MP3 to Firebase
-                    upload_audio_to_firebase(temp_mp3)
+                    # Record the codec so players pick the right decoder without probing
+                    document = {'name': filename, 'type': 'audio',
+                                'codec': profile['codec'], 'sampleRate': profile['rate']}
+                    if vad is not None:
+                        document['speechRatio'] = round(vad.speech_ratio(), 3)
+                    # Measure loudness once so every player can apply the same gain
+                    gain = meter.gain()
+                    if gain is not None:
+                        document['gain'] = gain
                     
-                    # Clean up temporary files
-                    if os.path.exists(temp_wav):
-                        os.remove(temp_wav)
-                    if os.path.exists(temp_mp3):
-                        os.remove(temp_mp3)
+                    # The upload queue finishes the upload in the background
+                    upload_queue.submit(upload, 'recordings', document)
                         
                 except subprocess.CalledProcessError as e:
                     logging.error(f"FFmpeg conversion error: {e.stderr.decode()}")
-                    messagebox.showerror("Conversion Error", "Failed to convert audio to MP3 format")
+                    upload.abort()
+                    messagebox.showerror("Conversion Error", f"Failed to encode audio with the {VOICE_PROFILE} profile")
                 except Exception as e:
                     logging.error(f"Error during audio processing: {e}")
+                    recording_queue.put(None)
+                    encoder.abort()
+                    upload.abort()
                     messagebox.showerror("Processing Error", f"Failed to process audio: {e}")
                 finally:
                     record_voice_btn.config(bg=BUTTON_BG, fg="white", text="Record Voice")
@@ -1354,45 +1076,6 @@ def toggle_record_voice():
         is_recording = False
         record_voice_btn.config(bg=BUTTON_BG, fg="white", text="Record Voice")
 
-def upload_audio_to_firebase(local_path):
-    """Upload audio file to Firebase Storage under voice_notes/"""
-    try:
-        # Create a unique filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"audio_{timestamp}.mp3"
-        
-        logger.debug(f"Attempting to upload audio: {local_path}")
-        
-        # Create the blob with the correct path for audio files
-        audio_blob = bucket.blob(f"voice_notes/{filename}")
-        
-        # Upload the file with content type
-        audio_blob.upload_from_filename(
-            local_path,
-            content_type='audio/mp3'
-        )
-        
-        # Make the file publicly accessible
-        audio_blob.make_public()
-        
-        # Get the public URL
-        public_url = audio_blob.public_url
-        
-        # Add metadata to Firestore
-        db.collection('recordings').add({
-            'name': filename,
-            'url': public_url,
-            'timestamp': firestore.SERVER_TIMESTAMP,
-            'type': 'audio'
-        })
-        
-        messagebox.showinfo("Success", f"Audio uploaded successfully!")
-        logger.info(f"Successfully uploaded {filename} to Firebase Storage")
-        
-    except Exception as e:
-        logger.error(f"Upload Error: {e}")
-        messagebox.showerror("Upload Error", f"Failed to upload audio: {str(e)}")
-
 def firestore_listener_thread():
     doc_ref = db.collection('commands').document('record')
     last_state = False
@@ -1496,6 +1179,7 @@ media_row.grid_rowconfigure(0, weight=1)
 media_row.grid_columnconfigure(0, weight=1)
 media_listbox = tk.Listbox(media_row, font=("DejaVu Sans", 12), width=40, height=7, bg="white", fg="#2C3E50", selectbackground=BUTTON_BG, selectforeground="white", relief="sunken", borderwidth=2)
 media_listbox.grid(row=0, column=0, padx=8, pady=8, sticky='nsew')
+media_list = MediaListModel(media_listbox)
 media_btns = tk.Frame(media_row, bg=STANDARD_BG)
 media_btns.grid(row=1, column=0, pady=2, sticky='ew')
 play_btn = create_small_button(media_btns, "Play", lambda: play_recording(get_selected_recording()), BUTTON_BG, width=8)
@@ -1509,6 +1193,10 @@ resume_btn.pack(side='left', padx=2, fill='x', expand=True)
 stop_btn = create_small_button(media_btns, "Stop", stop_playback, BUTTON_BG, width=8)
 stop_btn.config(state="disabled")
 stop_btn.pack(side='left', padx=2, fill='x', expand=True)
+back_btn = create_small_button(media_btns, "⏪", lambda: seek_playback(-PLAYBACK_SEEK_STEP), BUTTON_BG, width=3)
+back_btn.pack(side='left', padx=2)
+forward_btn = create_small_button(media_btns, "⏩", lambda: seek_playback(PLAYBACK_SEEK_STEP), BUTTON_BG, width=3)
+forward_btn.pack(side='left', padx=2)
 
 # Initialize data after UI is created
 fetch_user_data()
@@ -1517,12 +1205,22 @@ fetch_current_task()
 update_media_player()
 setup_realtime_listeners()
 start_task_checker()
+upload_queue.start()
+audio_engine.start()
+if PRE_EVENT_ENABLED:
+    pre_event_buffer.start()
 
 # Update the cleanup on window close
 def on_closing():
     try:
         # Stop task checker
         stop_task_checker()
+        # Stop the pre-event buffer and release the camera
+        pre_event_buffer.stop()
+        # Stop the upload workers, pending uploads stay in the journal
+        upload_queue.stop()
+        # Close the audio output
+        audio_engine.close()
         # Clean up temporary files
         cleanup_temp_files()
         # Destroy the window
@@ -1537,4 +1235,7 @@ root.protocol("WM_DELETE_WINDOW", on_closing)
 listener_thread = threading.Thread(target=firestore_listener_thread, daemon=True)
 listener_thread.start()
 
+# Redraw whatever the listeners reported before the main loop was running
+root.after(UI_REFRESH_DELAY, apply_ui_refresh)
+
 root.mainloop()
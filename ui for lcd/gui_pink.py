@@ -2,7 +2,6 @@ import tkinter as tk
 from tkinter import messagebox, simpledialog
 import datetime
 import os
-import cv2
 import sounddevice as sd
 import soundfile as sf
 from scipy.io.wavfile import write
@@ -80,14 +79,6 @@ is_recording = False
 recording_thread = None
 recording_buffer = []
 
-# Camera server variables
-camera_server = None
-camera = None
-camera_thread = None
-is_streaming = False
-frame = None
-frame_lock = threading.Lock()
-
 # Constants for UI consistency
 STANDARD_FONT = ("DejaVu Sans", 12)  # Using DejaVu Sans which is better supported on Raspberry Pi
 TITLE_FONT = ("DejaVu Sans", 24, "bold")
@@ -125,148 +116,6 @@ stop_task_check = threading.Event()
 flask_server_process = None
 flask_server_running = False
 
-# Camera server functions
-def init_camera():
-    """Initialize the USB camera"""
-    global camera
-    try:
-        # Try to open the USB camera (0 is usually the default camera)
-        camera = cv2.VideoCapture(0)
-        if not camera.isOpened():
-            logger.error("Failed to open camera")
-            return False
-        
-        # Set camera properties
-        camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        camera.set(cv2.CAP_PROP_FPS, 30)
-        
-        logger.info("USB Camera initialized successfully")
-        return True
-    except Exception as e:
-        logger.error(f"Error initializing camera: {e}")
-        return False
-
-def release_camera():
-    """Release the camera resources"""
-    global camera, is_streaming
-    is_streaming = False
-    if camera is not None:
-        try:
-            camera.release()
-            logger.info("Camera released successfully")
-        except Exception as e:
-            logger.error(f"Error releasing camera: {e}")
-
-def camera_stream():
-    """Function to capture frames from the camera"""
-    global camera, is_streaming, frame
-    
-    while is_streaming:
-        try:
-            ret, current_frame = camera.read()
-            if ret:
-                with frame_lock:
-                    frame = current_frame.copy()
-            else:
-                logger.warning("Failed to capture frame")
-                time.sleep(0.1)
-        except Exception as e:
-            logger.error(f"Error in camera stream: {e}")
-            time.sleep(0.1)
-
-def generate_frames():
-    """Generator function to yield frames for streaming"""
-    global frame
-    
-    while True:
-        with frame_lock:
-            if frame is not None:
-                # Convert frame to JPEG with quality settings
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                if ret:
-                    # Yield the frame in MJPEG format
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-            else:
-                time.sleep(0.1)
-
-def start_camera_server():
-    """Start the Flask camera server"""
-    global camera_server, is_streaming, camera_thread, flask_server_running
-    
-    if flask_server_running:
-        logger.info("Flask camera server already running.")
-        return
-    try:
-        if camera_server is None:
-            camera_server = Flask(__name__)
-            
-            @camera_server.route('/')
-            def index():
-                return "USB Camera Streaming Server"
-            
-            @camera_server.route('/start-stream', methods=['POST'])
-            def start_stream():
-                global camera, camera_thread, is_streaming
-                
-                try:
-                    if is_streaming:
-                        return jsonify({"status": "success", "message": "Camera already streaming"})
-                    
-                    if not init_camera():
-                        return jsonify({"status": "error", "message": "Failed to initialize camera"}), 500
-                    
-                    is_streaming = True
-                    camera_thread = threading.Thread(target=camera_stream)
-                    camera_thread.daemon = True
-                    camera_thread.start()
-                    
-                    logger.info("Camera stream started")
-                    return jsonify({"status": "success", "message": "Camera stream started"})
-                except Exception as e:
-                    logger.error(f"Error starting stream: {e}")
-                    return jsonify({"status": "error", "message": str(e)}), 500
-            
-            @camera_server.route('/stop-stream', methods=['POST'])
-            def stop_stream():
-                global is_streaming
-                
-                try:
-                    if not is_streaming:
-                        return jsonify({"status": "success", "message": "Camera already stopped"})
-                    
-                    release_camera()
-                    return jsonify({"status": "success", "message": "Camera stream stopped"})
-                except Exception as e:
-                    logger.error(f"Error stopping stream: {e}")
-                    return jsonify({"status": "error", "message": str(e)}), 500
-            
-            @camera_server.route('/stream')
-            def video_feed():
-                return Response(generate_frames(),
-                              mimetype='multipart/x-mixed-replace; boundary=frame')
-            
-            @camera_server.route('/status')
-            def status():
-                return jsonify({
-                    "status": "success",
-                    "is_streaming": is_streaming,
-                    "camera_initialized": camera is not None
-                })
-            
-            # Start the Flask server in a separate thread
-            server_thread = threading.Thread(target=lambda: camera_server.run(host='0.0.0.0', port=5000, threaded=True))
-            server_thread.daemon = True
-            server_thread.start()
-            
-            logger.info("Camera server started on port 5000")
-            flask_server_running = True
-            return True
-    except Exception as e:
-        logger.error(f"Error starting camera server: {e}")
-        return False
-
 def show_camera():
     """Show the camera stream in a web browser"""
     try:
@@ -0,0 +1,195 @@
+import os
+import time
+import heapq
+import bisect
+import sqlite3
+import logging
+import itertools
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Task scheduler settings
+TASK_DISPLAY_WINDOW = 300  # Seconds either side of scheduledTime a task is shown as current
+REMINDER_GRACE = float(os.environ.get("REMINDER_GRACE", "300"))  # Seconds late a reminder may still catch up
+REMINDER_STORE = os.environ.get("REMINDER_STORE", "reminders_fired.db")
+SCHEDULER_MAX_SLEEP = 60  # Re-check the wall clock at least this often, in case it jumps
+
+
+class TaskScheduler:
+    """Wakes up exactly when pending tasks need attention, fed by Firestore snapshot deltas.
+
+    apply_changes() takes the change set of a `tasks` snapshot and keeps the
+    incomplete tasks in memory, in a list sorted on scheduledTime so the
+    current task is found by bisection. Every task puts three wake-ups on a
+    min-heap keyed on time: when it enters the display window, when its
+    reminder is due and when it leaves the window again. A single thread sleeps until
+    the earliest of them, so after the initial snapshot nothing is polled
+    and nothing is read from Firestore. Wake-ups left behind by tasks that
+    were rescheduled, completed or deleted are skipped when they come up.
+
+    Each occurrence (task ID and scheduledTime) fires exactly once: it is
+    added to a fired-set, kept in memory and in SQLite, before on_due is
+    called, and anything already in the set is never fired again. A
+    reminder found late, after a stall or a restart, still fires if it is
+    no more than REMINDER_GRACE seconds overdue.
+    """
+
+    def __init__(self, on_due, on_refresh, path=REMINDER_STORE, clock=time.time):
+        self.on_due = on_due  # Called with a task record when its reminder is due
+        self.on_refresh = on_refresh  # Called when the current task may have changed
+        self.clock = clock  # Wall clock in seconds, the timebase of scheduledTime
+        self.tasks = {}  # Incomplete task records by document ID
+        self.index = []  # (scheduled time, task ID) of every incomplete task, sorted
+        self.heap = []  # (time, sequence, kind, task ID, scheduled time)
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = None
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS fired (
+                                 task_id TEXT,
+                                 scheduled REAL,
+                                 fired_at REAL,
+                                 PRIMARY KEY (task_id, scheduled))""")
+        # Occurrences older than the grace window can never fire again
+        with self.conn:
+            self.conn.execute("DELETE FROM fired WHERE scheduled < ?", (self.clock() - REMINDER_GRACE,))
+        self.fired = set(self.conn.execute("SELECT task_id, scheduled FROM fired"))
+        logger.debug(f"Loaded {len(self.fired)} fired reminders from {path}")
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped = False
+            self.thread = threading.Thread(target=self._run, name="task-scheduler", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread:
+            self.thread.join(timeout=1)
+
+    def apply_changes(self, changes):
+        """Apply a Firestore snapshot change set; returns True if the pending tasks changed"""
+        changed = False
+        with self.condition:
+            for change in changes:
+                doc = change.document
+                data = (doc.to_dict() or {}) if change.type.name != 'REMOVED' else {}
+                if change.type.name == 'REMOVED' or data.get('isCompleted', False):
+                    current = self.tasks.pop(doc.id, None)
+                    if current is not None:
+                        self._unindex(current)
+                        changed = True
+                    continue
+                task = {
+                    'id': doc.id,
+                    'ref': doc.reference,  # So Done and Snooze write to this document only
+                    'task': data.get('task'),
+                    'scheduled': data.get('scheduledTime', 0) / 1000,
+                    'sent_time': data.get('sentTime'),
+                    'due_time': data.get('dueTime'),
+                    'recording_url': data.get('recordingUrl'),
+                }
+                current = self.tasks.get(doc.id)
+                if task == current:
+                    continue
+                self.tasks[doc.id] = task
+                changed = True
+                if current is None or current['scheduled'] != task['scheduled']:
+                    if current is not None:
+                        self._unindex(current)
+                    bisect.insort(self.index, (task['scheduled'], task['id']))
+                    self._push(task)
+            self.condition.notify()
+        return changed
+
+    def current(self, now=None):
+        """The pending task closest to now within TASK_DISPLAY_WINDOW, or None"""
+        now = self.clock() if now is None else now
+        with self.condition:
+            # Only the neighbours either side of now can be the closest
+            position = bisect.bisect_left(self.index, (now,))
+            neighbours = self.index[max(0, position - 1):position + 1]
+            scheduled, task_id = min(neighbours, key=lambda entry: abs(now - entry[0]), default=(None, None))
+            if task_id is None or abs(now - scheduled) > TASK_DISPLAY_WINDOW:
+                return None
+            return self.tasks[task_id]
+
+    def discard(self, task_id):
+        """Forget a task straight away, before the listener reports it; returns True if it was pending"""
+        with self.condition:
+            task = self.tasks.pop(task_id, None)
+            if task is not None:
+                self._unindex(task)
+        return task is not None
+
+    def _unindex(self, task):
+        """Drop a task from the sorted index; called with the lock held"""
+        entry = (task['scheduled'], task['id'])
+        position = bisect.bisect_left(self.index, entry)
+        if position < len(self.index) and self.index[position] == entry:
+            del self.index[position]
+
+    def _push(self, task):
+        """Queue the wake-ups for a new or rescheduled task; called with the lock held"""
+        scheduled = task['scheduled']
+        for when, kind in ((scheduled - TASK_DISPLAY_WINDOW, 'show'),
+                           (scheduled, 'due'),
+                           (scheduled + TASK_DISPLAY_WINDOW, 'hide')):
+            heapq.heappush(self.heap, (when, next(self.sequence), kind, task['id'], scheduled))
+
+    def _claim(self, task_id, scheduled, now):
+        """Record an occurrence as fired; False if it already was or is past the grace window"""
+        if (task_id, scheduled) in self.fired:
+            return False
+        if now - scheduled > REMINDER_GRACE:
+            logger.info(f"Reminder for task {task_id} is {now - scheduled:.0f}s late, skipping")
+            return False
+        self.fired.add((task_id, scheduled))
+        try:
+            with self.conn:
+                self.conn.execute("INSERT OR IGNORE INTO fired (task_id, scheduled, fired_at) VALUES (?, ?, ?)",
+                                  (task_id, scheduled, now))
+        except Exception as e:
+            logger.error(f"Could not record fired reminder for task {task_id}: {e}")
+        return True
+
+    def run_pending(self, now=None):
+        """Handle every wake-up due by now, firing reminders; returns the tasks that fired"""
+        now = self.clock() if now is None else now
+        due, refresh = [], False
+        with self.condition:
+            while self.heap and self.heap[0][0] <= now:
+                when, _, kind, task_id, scheduled = heapq.heappop(self.heap)
+                task = self.tasks.get(task_id)
+                if task is None or task['scheduled'] != scheduled:
+                    continue  # Rescheduled, completed or deleted since it was queued
+                refresh = True
+                if kind == 'due' and self._claim(task_id, scheduled, now):
+                    due.append(task)
+
+        # Callbacks run outside the lock so they can read the scheduler
+        for task in due:
+            try:
+                self.on_due(task)
+            except Exception as e:
+                logger.error(f"Error firing reminder for task {task['id']}: {e}")
+        if refresh:
+            try:
+                self.on_refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing current task: {e}")
+        return due
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.stopped and (not self.heap or self.heap[0][0] > self.clock()):
+                    delay = self.heap[0][0] - self.clock() if self.heap else SCHEDULER_MAX_SLEEP
+                    self.condition.wait(min(delay, SCHEDULER_MAX_SLEEP))
+                if self.stopped:
+                    return
+            self.run_pending()
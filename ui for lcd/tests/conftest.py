@@ -0,0 +1,31 @@
+import os
+import sys
+import types
+
+import pytest
+
+# The GUI modules live next to this folder and are imported as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeDocument:
+    """The parts of a Firestore DocumentSnapshot the snapshot handlers read"""
+
+    def __init__(self, id, data):
+        self.id = id
+        self.data = data
+        self.reference = ('ref', id)
+
+    def to_dict(self):
+        return dict(self.data)
+
+
+def change(kind, id, data=None):
+    """A Firestore DocumentChange of kind 'ADDED', 'MODIFIED' or 'REMOVED'"""
+    return types.SimpleNamespace(type=types.SimpleNamespace(name=kind),
+                                 document=FakeDocument(id, data or {}))
+
+
+@pytest.fixture
+def make_change():
+    return change
@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+
+try:
+    import audio
+except (ImportError, OSError) as e:  # sounddevice needs the PortAudio library
+    pytest.skip(f"audio module unavailable: {e}", allow_module_level=True)
+
+RATE = 48000
+
+
+def tone(amplitude, seconds, frequency=997, rate=RATE):
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def in_blocks(samples, size):
+    return [samples[start:start + size] for start in range(0, len(samples), size)]
+
+
+def test_loudness_of_a_reference_tone():
+    # BS.1770: a full scale 997 Hz sine in one channel measures -3.01 LUFS
+    meter = audio.LoudnessMeter(RATE)
+    meter.add(tone(0.1, 3))
+    assert meter.integrated() == pytest.approx(-23.01, abs=0.1)
+
+
+def test_loudness_does_not_depend_on_block_size():
+    samples = tone(0.1, 2) * np.linspace(0.2, 1.0, 2 * RATE, dtype=np.float32)
+    whole = audio.LoudnessMeter(RATE)
+    whole.add(samples)
+    blocked = audio.LoudnessMeter(RATE)
+    for block in in_blocks(samples, 2048):
+        blocked.add(block)
+    assert blocked.integrated() == pytest.approx(whole.integrated(), abs=1e-6)
+
+
+def test_gain_reaches_target_within_limits():
+    meter = audio.LoudnessMeter(RATE)
+    meter.add(tone(0.1, 3))
+    assert 20 * np.log10(meter.gain()) == pytest.approx(audio.TARGET_LUFS + 23.01, abs=0.1)
+
+    quiet = audio.LoudnessMeter(RATE)
+    quiet.add(tone(0.0005, 3))
+    assert quiet.gain() == pytest.approx(10 ** (audio.MAX_GAIN_DB / 20))
+
+    spiky = tone(0.01, 3)
+    spiky[RATE] = 0.9
+    meter = audio.LoudnessMeter(RATE)
+    meter.add(spiky)
+    assert meter.gain() == pytest.approx(audio.PEAK_CEILING / 0.9)
+
+
+def test_no_gain_for_short_or_silent_clips():
+    short = audio.LoudnessMeter(RATE)
+    short.add(tone(0.1, 0.3))
+    assert short.gain() is None
+    silent = audio.LoudnessMeter(RATE)
+    silent.add(np.zeros(3 * RATE, dtype=np.float32))
+    assert silent.gain() is None
+
+
+def rms_db(samples):
+    return 10 * np.log10(np.mean(np.asarray(samples, dtype=np.float64) ** 2))
+
+
+def process(processor, samples, size=2048):
+    return np.concatenate([processor.process(block) for block in in_blocks(samples, size)])
+
+
+def test_voice_processor_keeps_speech_band_and_cuts_hum_and_hiss():
+    for frequency, change_db in ((1000, (-1, 1)), (50, (-60, -20)), (7000, (-60, -12))):
+        samples = tone(0.3, 2, frequency)
+        cleaned = process(audio.VoiceProcessor(RATE), samples)
+        # Skip the first second while the filters settle
+        assert change_db[0] < rms_db(cleaned[RATE:]) - rms_db(samples[RATE:]) < change_db[1], frequency
+
+
+def test_voice_processor_removes_dc_and_pushes_down_room_noise():
+    offset = tone(0.1, 2) + np.float32(0.2)
+    cleaned = process(audio.VoiceProcessor(RATE), offset)
+    assert abs(np.mean(cleaned[RATE:])) < 1e-3
+
+    quiet = tone(0.001, 2)
+    cleaned = process(audio.VoiceProcessor(RATE), quiet)
+    assert rms_db(cleaned[RATE:]) - rms_db(quiet[RATE:]) == pytest.approx(audio.GATE_FLOOR_DB, abs=1)
+
+
+def test_voice_processor_output_does_not_depend_on_block_size():
+    samples = tone(0.3, 1) * np.linspace(0, 1, RATE, dtype=np.float32)
+    large = process(audio.VoiceProcessor(RATE), samples, 2048)
+    small = process(audio.VoiceProcessor(RATE), samples, 333)
+    assert len(large) == len(small) == len(samples)
+    np.testing.assert_allclose(large, small, atol=1e-6)
+
+
+def voice(seconds, bursts, noise=0.0, seed=0):
+    """Syllable-like 300 Hz bursts over white noise; bursts are (start, end) in seconds"""
+    t = np.arange(int(seconds * RATE)) / RATE
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 2
+    envelope *= np.any([(t >= start) & (t < end) for start, end in bursts], axis=0)
+    samples = 0.2 * np.sin(2 * np.pi * 300 * t) * envelope
+    samples += noise * np.random.default_rng(seed).standard_normal(len(t))
+    return samples.astype(np.float32)
+
+
+def detect(samples):
+    """Run samples through the recorder's chain; returns the detector and the seconds passed on"""
+    processor = audio.VoiceProcessor(RATE)
+    vad = audio.VoiceActivityDetector(RATE)
+    passed = sum(len(vad.process(processor.process(block))) for block in in_blocks(samples, 2048))
+    return vad, passed / RATE
+
+
+@pytest.mark.parametrize('noise', [0.0, 0.005, 0.015, 0.03, 0.1])
+def test_steady_noise_is_not_speech(noise):
+    vad, passed = detect(voice(12, [], noise))
+    assert not vad.heard_speech
+    assert passed == 0
+    assert vad.speech_ratio() == 0
+    assert vad.silence == pytest.approx(12, abs=0.1)
+
+
+@pytest.mark.parametrize('noise', [0.0, 0.015, 0.03])
+def test_speech_in_noise_is_kept_and_the_silence_around_it_dropped(noise):
+    vad, passed = detect(voice(20, [(3, 6)], noise))
+    assert vad.heard_speech
+    # Three seconds of speech plus at most the pre-roll and hangover
+    assert 2.5 < passed < 3 + audio.VAD_PREROLL + audio.VAD_HANGOVER + 0.1
+    assert vad.silence == pytest.approx(14, abs=0.5)
+    assert 0.03 < vad.speech_ratio() < 3 / 20
+
+
+def test_speech_from_the_first_frame_is_kept():
+    vad, passed = detect(voice(6, [(0, 3)], 0.015))
+    assert vad.heard_speech
+    assert passed > 2.5
+
+
+def test_long_pauses_are_shortened():
+    vad, passed = detect(voice(10, [(1, 2), (6, 7)]))
+    assert 1.8 < passed < 2 + audio.VAD_MAX_PAUSE + audio.VAD_PREROLL + 2 * audio.VAD_HANGOVER + 0.1
@@ -0,0 +1,140 @@
+import threading
+import time
+from urllib.parse import parse_qs
+
+import numpy as np
+import pytest
+
+import camera_server
+from camera_server import STREAM_TIERS, StreamTierController, parse_stream_params, pick_stream_tier, query_arg_getter
+
+
+def test_pick_stream_tier_never_exceeds_the_request():
+    assert pick_stream_tier(80, 1.0) == 0
+    assert pick_stream_tier(100, 2.0) == 0
+    assert pick_stream_tier(70, 1.0) == 1
+    assert pick_stream_tier(75, 0.6) == 2
+    assert pick_stream_tier(10, 0.1) == len(STREAM_TIERS) - 1
+
+
+def test_parse_stream_params_clamps_and_ignores_bad_values():
+    get_arg = query_arg_getter(parse_qs("quality=60&scale=0.5&fps=100"))
+    assert parse_stream_params(get_arg) == (camera_server.STREAM_MAX_FPS, 2)
+    get_arg = query_arg_getter(parse_qs("quality=abc&fps=0"))
+    assert parse_stream_params(get_arg) == (1, 0)
+
+
+def test_tier_controller_steps_down_on_slow_writes_and_back_up():
+    tiers = StreamTierController(1, 30)
+    slow = tiers.frame_interval * camera_server.STREAM_SLOW_WRITE * 2
+
+    # An isolated slow write is not enough
+    tiers.record_write(slow)
+    tiers.record_write(0)
+    assert tiers.tier_index == 1
+
+    for _ in range(camera_server.STREAM_STEP_DOWN_AFTER):
+        tiers.record_write(slow)
+    assert tiers.tier == STREAM_TIERS[2]
+
+    for _ in range(camera_server.STREAM_STEP_UP_AFTER):
+        tiers.record_write(0)
+    assert tiers.tier_index == 1
+
+    # Never above the tier the client asked for
+    for _ in range(3 * camera_server.STREAM_STEP_UP_AFTER):
+        tiers.record_write(0)
+    assert tiers.tier_index == 1
+
+
+def test_tier_controller_stops_at_the_cheapest_tier():
+    tiers = StreamTierController(0, 30)
+    for _ in range(10 * len(STREAM_TIERS) * camera_server.STREAM_STEP_DOWN_AFTER):
+        tiers.record_write(1.0)
+    assert tiers.tier_index == len(STREAM_TIERS) - 1
+
+
+class FakeCapture:
+    """Stands in for cv2.VideoCapture, producing small frames at about 100 fps"""
+
+    stalled = False  # Set to stop delivering frames, like an unplugged camera
+
+    def __init__(self, device):
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return True
+
+    def read(self):
+        time.sleep(0.01)
+        if FakeCapture.stalled:
+            return False, None
+        return True, np.zeros((48, 64, 3), np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    FakeCapture.stalled = False
+    monkeypatch.setattr(camera_server.cv2, 'VideoCapture', FakeCapture)
+    bus = camera_server.FrameBus()
+    monkeypatch.setattr(camera_server, 'frame_bus', bus)
+    yield bus
+    for name in list(bus.subscribers):
+        bus.unsubscribe(name)
+
+
+def test_frame_bus_never_hands_out_frames_from_an_earlier_session(bus):
+    assert bus.subscribe('viewer')
+    first = bus.wait_for(0)
+    assert first is not None
+    bus.unsubscribe('viewer')
+    old_seq = bus.seq
+
+    FakeCapture.stalled = True
+    assert bus.subscribe('viewer')
+    assert bus.latest() is None
+    assert bus.wait_for(0, timeout=0.2) is None
+    FakeCapture.stalled = False
+    entry = bus.wait_for(0)
+    assert entry[0] > old_seq
+    assert bus.latest()[0] > old_seq
+
+
+def finish_in_background(recorder):
+    thread = threading.Thread(target=recorder.wait, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_overlapping_recorders_both_finish(bus, tmp_path):
+    first = camera_server.VideoRecorder(str(tmp_path / 'first.mp4'), duration=0.5, encoder='opencv')
+    second = camera_server.VideoRecorder(str(tmp_path / 'second.mp4'), duration=1.0, encoder='opencv')
+    assert first.subscriber != second.subscriber
+    assert first.start()
+    time.sleep(0.2)
+    assert second.start()
+    assert camera_server.handle_status()[0]['is_recording']
+
+    waiting = [finish_in_background(first), finish_in_background(second)]
+    for thread in waiting:
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+    assert second.frames_written > first.frames_written > 0
+    assert not camera_server.handle_status()[0]['is_recording']
+    assert not bus.running
+
+
+def test_recorder_stops_on_time_when_the_camera_stalls(bus, tmp_path):
+    recorder = camera_server.VideoRecorder(str(tmp_path / 'clip.mp4'), duration=0.5, encoder='opencv')
+    assert recorder.start()
+    time.sleep(0.2)
+    FakeCapture.stalled = True
+    thread = finish_in_background(recorder)
+    thread.join(timeout=3)
+    assert not thread.is_alive()
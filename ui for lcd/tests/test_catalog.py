@@ -0,0 +1,112 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from catalog import RecordingsCatalog
+
+
+class FakeBlob:
+    def __init__(self, name, generation=1, public_url=None):
+        self.name = name
+        self.generation = generation
+        self.public_url = public_url or f"https://storage.example/{name}"
+        self.time_created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.made_public = 0
+
+    def make_public(self):
+        self.made_public += 1
+
+
+class FakeBucket:
+    def __init__(self, blobs):
+        self.blobs = blobs
+        self.listed = []
+        self.on_list = None  # Called after the first listing, to race a snapshot against it
+
+    def list_blobs(self, prefix):
+        self.listed.append(prefix)
+        blobs = [blob for blob in self.blobs if blob.name.startswith(prefix)]
+        if self.on_list:
+            self.on_list()
+            self.on_list = None
+        return blobs
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "catalog.db")
+
+
+def recording(name, url=None, when=1):
+    return {'name': name, 'storagePath': f'recordings/{name}', 'url': url or f'https://cdn.example/{name}',
+            'timestamp': datetime(2024, 1, when, tzinfo=timezone.utc), 'gain': 0.5}
+
+
+def test_applies_snapshot_changes_newest_first(path, make_change):
+    catalog = RecordingsCatalog(path)
+    assert catalog.apply_changes([
+        make_change('ADDED', 'a', recording('a.wav', when=1)),
+        make_change('ADDED', 'b', recording('b.wav', when=2)),
+        make_change('ADDED', 'v', {'storagePath': 'voice_notes/v.mp3', 'url': 'u', 'codec': 'mp3'}),
+        make_change('ADDED', 'x', {'storagePath': 'videos/x.mp4', 'url': 'u'}),
+    ])
+    assert [r['id'] for r in catalog.recordings()] == ['recordings/b.wav', 'recordings/a.wav', 'voice_notes/v.mp3']
+    assert catalog.entries['voice_notes/v.mp3']['codec'] == 'mp3'
+
+    # A repeated snapshot changes nothing
+    assert not catalog.apply_changes([make_change('MODIFIED', 'a', recording('a.wav', when=1))])
+
+    assert catalog.apply_changes([make_change('MODIFIED', 'a', recording('renamed.wav', when=3)
+                                              | {'storagePath': 'recordings/a.wav'}),
+                                  make_change('REMOVED', 'b')])
+    assert [(r['id'], r['name']) for r in catalog.recordings()] == [
+        ('recordings/a.wav', 'renamed.wav'), ('voice_notes/v.mp3', 'v.mp3')]
+
+
+def test_persists_across_restarts(path, make_change):
+    RecordingsCatalog(path).apply_changes([make_change('ADDED', 'a', recording('a.wav'))])
+    entry = RecordingsCatalog(path).entries['recordings/a.wav']
+    assert entry['url'] == 'https://cdn.example/a.wav'
+    assert entry['gain'] == 0.5
+    assert entry['timestamp'] == datetime.fromtimestamp(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+def test_sync_storage_only_makes_undocumented_blobs_public_once(path, make_change):
+    catalog = RecordingsCatalog(path)
+    catalog.apply_changes([make_change('ADDED', 'a', recording('a.wav'))])
+    documented = FakeBlob('recordings/a.wav')
+    offline = FakeBlob('voice_notes/b.mp3')
+    bucket = FakeBucket([documented, offline, FakeBlob('recordings/')])
+
+    assert catalog.sync_storage(bucket)
+    assert bucket.listed == ['recordings/', 'voice_notes/']
+    assert documented.made_public == 0
+    assert offline.made_public == 1
+    assert catalog.entries['voice_notes/b.mp3']['url'] == offline.public_url
+    assert catalog.entries['recordings/a.wav']['url'] == 'https://cdn.example/a.wav'
+    assert 'recordings/' not in catalog.entries
+
+    # Same generations: nothing to do
+    assert not catalog.sync_storage(bucket)
+    assert offline.made_public == 1
+
+    # A new generation of an undocumented blob is made public again
+    offline.generation = 2
+    assert catalog.sync_storage(bucket)
+    assert offline.made_public == 2
+
+
+def test_sync_storage_removes_deleted_blobs(path, make_change):
+    catalog = RecordingsCatalog(path)
+    catalog.apply_changes([make_change('ADDED', 'a', recording('a.wav')),
+                           make_change('ADDED', 'b', recording('b.wav'))])
+    assert catalog.sync_storage(FakeBucket([FakeBlob('recordings/a.wav')]))
+    assert list(catalog.entries) == ['recordings/a.wav']
+
+
+def test_sync_storage_keeps_entries_added_during_listing(path, make_change):
+    catalog = RecordingsCatalog(path)
+    bucket = FakeBucket([])
+    bucket.on_list = lambda: catalog.apply_changes([make_change('ADDED', 'new', recording('new.wav'))])
+    catalog.sync_storage(bucket)
+    assert 'recordings/new.wav' in catalog.entries
@@ -0,0 +1,204 @@
+import threading
+
+import pytest
+
+import tasks
+
+NOW = 1_700_000_000.0
+
+
+class Clock:
+    """Wall clock the test moves by hand"""
+
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Callbacks:
+    """on_due and on_refresh callbacks that remember what they were called with"""
+
+    def __init__(self):
+        self.fired = []
+        self.refreshes = 0
+        self.event = threading.Event()
+
+    def on_due(self, task):
+        self.fired.append(task['id'])
+        self.event.set()
+
+    def on_refresh(self):
+        self.refreshes += 1
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def callbacks():
+    return Callbacks()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return str(tmp_path / "fired.db")
+
+
+@pytest.fixture
+def scheduler(callbacks, store, clock):
+    return tasks.TaskScheduler(callbacks.on_due, callbacks.on_refresh, path=store, clock=clock)
+
+
+@pytest.fixture
+def added(make_change):
+    def added(task_id, scheduled, kind='ADDED', **fields):
+        """Snapshot change for a task due at scheduled seconds"""
+        return make_change(kind, task_id, dict({'task': task_id.upper(), 'scheduledTime': scheduled * 1000}, **fields))
+    return added
+
+
+def test_fires_when_due_and_not_before(scheduler, callbacks, added):
+    scheduler.apply_changes([added('a', NOW + 60)])
+    assert scheduler.run_pending(NOW + 59) == []
+    assert [task['id'] for task in scheduler.run_pending(NOW + 60)] == ['a']
+    assert callbacks.fired == ['a']
+    assert scheduler.run_pending(NOW + 61) == []
+
+
+def test_refreshes_when_tasks_enter_and_leave_the_window(scheduler, callbacks, added):
+    scheduler.apply_changes([added('a', NOW + 1000)])
+    scheduler.run_pending(NOW + 1000 - tasks.TASK_DISPLAY_WINDOW - 1)
+    assert callbacks.refreshes == 0
+    scheduler.run_pending(NOW + 1000 - tasks.TASK_DISPLAY_WINDOW)
+    assert callbacks.refreshes == 1
+    scheduler.run_pending(NOW + 1000)
+    assert callbacks.refreshes == 2
+    scheduler.run_pending(NOW + 1000 + tasks.TASK_DISPLAY_WINDOW)
+    assert callbacks.refreshes == 3
+    assert callbacks.fired == ['a']
+
+
+def test_rescheduled_task_fires_at_its_new_time_only(scheduler, callbacks, added):
+    scheduler.apply_changes([added('a', NOW + 60)])
+    scheduler.apply_changes([added('a', NOW + 120, kind='MODIFIED')])
+    scheduler.run_pending(NOW + 100)
+    assert callbacks.fired == []
+    scheduler.run_pending(NOW + 120)
+    assert callbacks.fired == ['a']
+
+
+def test_completed_and_removed_tasks_never_fire(scheduler, callbacks, added, make_change):
+    scheduler.apply_changes([added('a', NOW + 60), added('b', NOW + 60), added('c', NOW + 60, isCompleted=True)])
+    scheduler.apply_changes([make_change('REMOVED', 'a'), added('b', NOW + 60, kind='MODIFIED', isCompleted=True)])
+    scheduler.run_pending(NOW + 60)
+    assert callbacks.fired == []
+    assert scheduler.tasks == {}
+
+
+def test_apply_changes_reports_whether_pending_tasks_changed(scheduler, added):
+    assert scheduler.apply_changes([added('a', NOW + 60)])
+    assert not scheduler.apply_changes([added('a', NOW + 60, kind='MODIFIED')])
+    assert scheduler.apply_changes([added('a', NOW + 60, kind='MODIFIED', task='Renamed')])
+
+
+def test_thread_wakes_up_for_the_next_due_task(callbacks, store, added):
+    scheduler = tasks.TaskScheduler(callbacks.on_due, callbacks.on_refresh, path=store)
+    scheduler.start()
+    try:
+        # Due straight away: the sleeping thread must be woken by apply_changes()
+        scheduler.apply_changes([added('a', scheduler.clock())])
+        assert callbacks.event.wait(timeout=5)
+    finally:
+        scheduler.stop()
+    assert callbacks.fired == ['a']
+
+
+def test_repeated_deliveries_fire_once(scheduler, callbacks, added, make_change):
+    scheduler.apply_changes([added('a', NOW + 60)])
+    scheduler.apply_changes([added('a', NOW + 60)])
+    scheduler.apply_changes([added('a', NOW + 60, kind='MODIFIED')])
+    scheduler.run_pending(NOW + 60)
+    # Removed and added back with the same time is the same occurrence
+    scheduler.apply_changes([make_change('REMOVED', 'a')])
+    scheduler.apply_changes([added('a', NOW + 60)])
+    scheduler.run_pending(NOW + 61)
+    assert callbacks.fired == ['a']
+
+
+def test_each_occurrence_fires_once(scheduler, callbacks, added):
+    scheduler.apply_changes([added('a', NOW + 60)])
+    scheduler.run_pending(NOW + 60)
+    # Snoozed: a new occurrence of the same task
+    scheduler.apply_changes([added('a', NOW + 360, kind='MODIFIED')])
+    scheduler.run_pending(NOW + 360)
+    assert callbacks.fired == ['a', 'a']
+
+
+def test_fired_occurrences_survive_a_restart(scheduler, callbacks, store, clock, added):
+    scheduler.apply_changes([added('a', NOW + 60)])
+    scheduler.run_pending(NOW + 60)
+
+    clock.now = NOW + 70
+    restarted = tasks.TaskScheduler(callbacks.on_due, callbacks.on_refresh, path=store, clock=clock)
+    restarted.apply_changes([added('a', NOW + 60)])
+    assert restarted.run_pending() == []
+    assert callbacks.fired == ['a']
+
+
+def test_late_reminders_catch_up_within_the_grace_window(scheduler, callbacks, added, monkeypatch):
+    monkeypatch.setattr(tasks, 'REMINDER_GRACE', 60)
+    scheduler.apply_changes([added('late', NOW - 30), added('too-late', NOW - 120)])
+    scheduler.run_pending()
+    assert callbacks.fired == ['late']
+
+
+def test_stalled_scheduler_catches_up(scheduler, callbacks, added, monkeypatch):
+    monkeypatch.setattr(tasks, 'REMINDER_GRACE', 60)
+    scheduler.apply_changes([added('a', NOW + 10), added('b', NOW + 20), added('c', NOW + 100)])
+    # Nothing ran until well after a and c were due
+    scheduler.run_pending(NOW + 150)
+    assert callbacks.fired == ['c']
+    scheduler.apply_changes([added('d', NOW + 140)])
+    scheduler.run_pending(NOW + 160)
+    assert callbacks.fired == ['c', 'd']
+
+
+def test_old_fired_occurrences_are_pruned(scheduler, callbacks, store, clock, added, monkeypatch):
+    monkeypatch.setattr(tasks, 'REMINDER_GRACE', 60)
+    scheduler.apply_changes([added('a', NOW)])
+    scheduler.run_pending(NOW)
+    assert scheduler.fired == {('a', NOW)}
+
+    clock.now = NOW + 61
+    restarted = tasks.TaskScheduler(callbacks.on_due, callbacks.on_refresh, path=store, clock=clock)
+    assert restarted.fired == set()
+
+
+def test_current_is_the_closest_pending_task_in_the_window(scheduler, added):
+    scheduler.apply_changes([added('past', NOW - 200), added('soon', NOW + 100), added('later', NOW + 1000)])
+    assert scheduler.current()['id'] == 'soon'
+    assert scheduler.current(NOW - 250)['id'] == 'past'
+    assert scheduler.current(NOW + 1000 - tasks.TASK_DISPLAY_WINDOW)['id'] == 'later'
+    assert scheduler.current(NOW + 500) is None
+
+
+def test_index_follows_reschedules_completions_and_discards(scheduler, added):
+    scheduler.apply_changes([added('past', NOW - 200), added('soon', NOW + 100), added('later', NOW + 1000)])
+    scheduler.apply_changes([added('later', NOW + 10, kind='MODIFIED')])
+    assert scheduler.current()['id'] == 'later'
+    scheduler.apply_changes([added('later', NOW + 10, kind='MODIFIED', isCompleted=True)])
+    assert scheduler.discard('soon')
+    assert not scheduler.discard('soon')
+    assert scheduler.current()['id'] == 'past'
+    assert scheduler.index == [(NOW - 200, 'past')]
+    assert list(scheduler.tasks) == ['past']
+
+
+def test_task_records_carry_their_document_reference(scheduler, added):
+    scheduler.apply_changes([added('a', NOW)])
+    assert scheduler.current()['ref'] == ('ref', 'a')
+    assert scheduler.run_pending(NOW)[0]['ref'] == ('ref', 'a')
@@ -0,0 +1,340 @@
+import json
+import os
+import time
+
+import pytest
+from firebase_admin import firestore
+
+import uploads
+
+CHUNK = 256 * 1024
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeStorage:
+    """Resumable upload sessions that behave like Cloud Storage's"""
+
+    def __init__(self):
+        self.sessions = {}  # Session URL -> received bytes
+        self.objects = {}  # Blob name -> finalized bytes
+        self.created = 0
+        self.offline = False
+        self.expire_at = None  # Return 404 for this PUT number
+        self.puts = 0
+        self.cancelled = []  # Session URLs cancelled with DELETE
+
+    def create_session(self, name):
+        self.created += 1
+        url = f"session-{self.created}:{name}"
+        self.sessions[url] = bytearray()
+        return url
+
+    def put(self, url, data, headers, timeout):
+        if self.offline:
+            raise ConnectionError("offline")
+        self.puts += 1
+        if self.puts == self.expire_at:
+            return Response(404)
+        received = self.sessions[url]
+        span, total = headers['Content-Range'][len('bytes '):].split('/')
+        if span != '*':
+            first = int(span.split('-')[0])
+            assert first == len(received), f"chunk starts at {first}, session has {len(received)}"
+            received += data
+        if total != '*':
+            assert int(total) == len(received)
+            self.objects[url.split(':', 1)[1]] = bytes(received)
+            return Response(200)
+        return Response(308, {'Range': f'bytes=0-{len(received) - 1}'})
+
+    def delete(self, url, timeout):
+        self.cancelled.append(url)
+        del self.sessions[url]
+        return Response(499)
+
+
+class FakeBlob:
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        self.public_url = f"https://storage.example/{name}"
+
+    def create_resumable_upload_session(self, content_type):
+        if self.storage.offline:
+            raise ConnectionError("offline")
+        return self.storage.create_session(self.name)
+
+    def make_public(self):
+        if self.storage.offline:
+            raise ConnectionError("offline")
+
+
+class FakeBucket:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def blob(self, name):
+        return FakeBlob(self.storage, name)
+
+
+class FakeDB:
+    def __init__(self):
+        self.documents = {}  # (collection, ID) -> document
+        self.commits = 0
+
+    def batch(self):
+        db = self
+
+        class Batch:
+            def __init__(self):
+                self.writes = []
+
+            def set(self, ref, document):
+                self.writes.append((ref, document))
+
+            def commit(self):
+                db.commits += 1
+                db.documents.update(self.writes)
+
+        return Batch()
+
+    def collection(self, name):
+        class Collection:
+            def document(self, id):
+                return (name, id)
+
+        return Collection()
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = FakeStorage()
+    monkeypatch.setattr(uploads.requests, 'put', storage.put)
+    monkeypatch.setattr(uploads.requests, 'delete', storage.delete)
+    monkeypatch.setattr(uploads, 'UPLOAD_CHUNK_SIZE', CHUNK)
+    monkeypatch.setattr(uploads, 'UPLOAD_JOURNAL_DIR', str(tmp_path / "journal"))
+    monkeypatch.setattr(uploads, 'UPLOAD_RETRY_BASE', 0.05)
+    monkeypatch.setattr(uploads, 'UPLOAD_BATCH_DELAY', 0.05)
+    return storage
+
+
+def stream(storage, tmp_path, name, data, block=64 * 1024, offline_at=None):
+    """Write data into a StreamingUpload the way an encoder pump does"""
+    upload = uploads.StreamingUpload(FakeBlob(storage, name), 'video/mp4', str(tmp_path / name.replace('/', '_')))
+    for start in range(0, len(data), block):
+        if offline_at is not None and start >= offline_at:
+            storage.offline = True
+        upload.write(data[start:start + block])
+        time.sleep(0.001)  # Let the sender thread keep up
+    upload.finish()
+    return upload
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_streamed_upload_resumes_to_exact_bytes(storage, tmp_path):
+    data = os.urandom(5 * CHUNK + 1234)
+    upload = stream(storage, tmp_path, 'videos/a.mp4', data)
+    assert upload.offset > 0  # Full chunks went out while writing
+    assert upload.resume()
+    assert storage.objects['videos/a.mp4'] == data
+
+
+def test_offline_mid_stream_spools_the_rest(storage, tmp_path):
+    data = os.urandom(6 * CHUNK)
+    upload = stream(storage, tmp_path, 'videos/a.mp4', data, offline_at=3 * CHUNK)
+    state = upload.state()
+    assert state['spool_offset'] <= state['offset']
+    assert os.path.getsize(state['spool_path']) == len(data) - state['spool_offset']
+
+    storage.offline = False
+    resumed = uploads.StreamingUpload.from_state(FakeBlob(storage, 'videos/a.mp4'), state)
+    assert resumed.resume()
+    assert storage.objects['videos/a.mp4'] == data
+
+
+def test_slow_uplink_never_blocks_the_writer(storage, tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, 'UPLOAD_BUFFER_MAX', 2 * CHUNK)
+    put = storage.put
+
+    def slow_put(*args, **kwargs):
+        time.sleep(0.3)
+        return put(*args, **kwargs)
+
+    monkeypatch.setattr(uploads.requests, 'put', slow_put)
+    data = os.urandom(8 * CHUNK)
+    upload = uploads.StreamingUpload(FakeBlob(storage, 'videos/a.mp4'), 'video/mp4', str(tmp_path / 'a'))
+    slowest = 0
+    for start in range(0, len(data), 64 * 1024):
+        began = time.perf_counter()
+        upload.write(data[start:start + 64 * 1024])
+        slowest = max(slowest, time.perf_counter() - began)
+    upload.finish()
+    assert slowest < 0.1
+    assert upload.resume()
+    assert storage.objects['videos/a.mp4'] == data
+
+
+def test_abort_cancels_the_session_and_removes_the_spool(storage, tmp_path):
+    upload = uploads.StreamingUpload(FakeBlob(storage, 'videos/a.mp4'), 'video/mp4', str(tmp_path / 'a'))
+    upload.write(os.urandom(2 * CHUNK))
+    assert wait_for(lambda: upload.offset > 0)
+    storage.offline = True
+    upload.write(os.urandom(2 * CHUNK))
+    assert wait_for(lambda: upload.spool is not None)
+    storage.offline = False
+
+    upload.abort()
+    assert not upload.sender.is_alive()
+    assert storage.cancelled and storage.sessions == {}
+    assert not os.path.exists(upload.spool_path)
+    assert 'videos/a.mp4' not in storage.objects
+
+
+def test_abort_before_anything_was_sent(storage, tmp_path):
+    upload = uploads.StreamingUpload(FakeBlob(storage, 'videos/a.mp4'), 'video/mp4', str(tmp_path / 'a'))
+    upload.write(b'x' * 100)
+    upload.abort()
+    assert storage.created == 0 and storage.cancelled == []
+    assert not os.path.exists(upload.spool_path)
+
+
+def test_session_expiring_mid_stream_fails_instead_of_truncating(storage, tmp_path):
+    storage.expire_at = 3
+    data = os.urandom(8 * CHUNK)
+    upload = stream(storage, tmp_path, 'videos/a.mp4', data)
+    assert upload.failed
+    assert not upload.resume()
+    assert 'videos/a.mp4' not in storage.objects
+    # What was never sent is still on disk
+    assert os.path.getsize(upload.spool_path) > 0
+
+
+def test_session_expiring_with_full_spool_starts_over(storage, tmp_path):
+    storage.offline = True
+    data = os.urandom(3 * CHUNK)
+    upload = stream(storage, tmp_path, 'videos/a.mp4', data)
+    assert upload.state()['spool_offset'] == 0
+    storage.offline = False
+    storage.expire_at = storage.puts + 1
+    upload = uploads.StreamingUpload.from_state(FakeBlob(storage, 'videos/a.mp4'), upload.state())
+    assert not upload.resume()
+    assert not upload.failed
+    assert upload.offset == 0 and upload.session_url is None
+    assert upload.resume()
+    assert storage.objects['videos/a.mp4'] == data
+
+
+def test_queue_publishes_with_stable_document_ids(storage, tmp_path):
+    db = FakeDB()
+    published = []
+    queue = uploads.UploadQueue(FakeBucket(storage), db, on_published=published.append)
+    queue.start()
+    try:
+        data = os.urandom(2 * CHUNK + 10)
+        queue.submit(stream(storage, tmp_path, 'voice_notes/b.mp3', data), 'recordings', {'name': 'b', 'type': 'audio'})
+        assert wait_for(lambda: published)
+    finally:
+        queue.stop()
+    document = db.documents[('recordings', 'voice_notes_b.mp3')]
+    assert document['storagePath'] == 'voice_notes/b.mp3'
+    assert document['url'] == 'https://storage.example/voice_notes/b.mp3'
+    assert document['timestamp'] is firestore.SERVER_TIMESTAMP
+    assert storage.objects['voice_notes/b.mp3'] == data
+    assert queue.pending() == 0
+    assert not os.path.exists(str(tmp_path / 'voice_notes_b.mp3'))
+
+
+def test_queue_resumes_after_restart_and_never_duplicates(storage, tmp_path):
+    db = FakeDB()
+    storage.offline = True
+    queue = uploads.UploadQueue(FakeBucket(storage), db)
+    queue.start()
+    data = os.urandom(3 * CHUNK)
+    queue.submit(stream(storage, tmp_path, 'videos/a.mp4', data), 'videos', {'name': 'a', 'type': 'video'})
+    time.sleep(0.2)
+    queue.stop()
+    assert queue.pending() == 1
+
+    # Crash after the documents were committed but before the journal was cleared
+    storage.offline = False
+    db.documents[('videos', 'videos_a.mp4')] = {'name': 'a'}
+    queue = uploads.UploadQueue(FakeBucket(storage), db)
+    queue.start()
+    try:
+        assert wait_for(lambda: queue.pending() == 0)
+    finally:
+        queue.stop()
+    assert list(db.documents) == [('videos', 'videos_a.mp4')]
+    assert storage.objects['videos/a.mp4'] == data
+
+
+def test_completed_job_without_spool_still_publishes(storage, tmp_path):
+    # Crash after the journal recorded completion and the spool was removed
+    db = FakeDB()
+    os.makedirs(uploads.UPLOAD_JOURNAL_DIR)
+    job = {'blob': 'videos/a.mp4', 'collection': 'videos', 'document': {'name': 'a', 'type': 'video'},
+           'complete': True, 'url': None, 'attempts': 0, 'failed': False, 'content_type': 'video/mp4',
+           'spool_path': str(tmp_path / 'gone'), 'session_url': None, 'offset': 10, 'spool_offset': 0}
+    with open(os.path.join(uploads.UPLOAD_JOURNAL_DIR, 'videos_a.mp4.json'), 'w') as f:
+        json.dump(job, f)
+    queue = uploads.UploadQueue(FakeBucket(storage), db)
+    queue.start()
+    try:
+        assert wait_for(lambda: queue.pending() == 0)
+    finally:
+        queue.stop()
+    assert ('videos', 'videos_a.mp4') in db.documents
+
+
+def test_failed_upload_is_set_aside(storage, tmp_path):
+    storage.expire_at = 3
+    db = FakeDB()
+    queue = uploads.UploadQueue(FakeBucket(storage), db)
+    queue.start()
+    try:
+        queue.submit(stream(storage, tmp_path, 'videos/a.mp4', os.urandom(8 * CHUNK)), 'videos', {'name': 'a'})
+        assert wait_for(lambda: queue.pending() == 0)
+    finally:
+        queue.stop()
+    assert db.documents == {}
+    assert os.listdir(uploads.UPLOAD_JOURNAL_DIR) == ['videos_a.mp4.json.failed']
+
+
+def test_short_spool_is_never_finalized(storage, tmp_path):
+    # Power was lost before the spool's tail reached the disk
+    storage.offline = True
+    upload = stream(storage, tmp_path, 'videos/a.mp4', os.urandom(3 * CHUNK))
+    with open(upload.spool_path, 'r+b') as f:
+        f.truncate(2 * CHUNK + 100)
+    storage.offline = False
+    resumed = uploads.StreamingUpload.from_state(FakeBlob(storage, 'videos/a.mp4'), upload.state())
+    assert not resumed.resume()
+    assert resumed.failed
+    assert 'videos/a.mp4' not in storage.objects
+
+
+def test_spool_reaches_the_disk_before_its_journal_entry(storage, tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+
+    def record_fsync(fd):
+        synced.append(os.readlink(f"/proc/self/fd/{fd}"))
+        fsync(fd)
+
+    monkeypatch.setattr(os, 'fsync', record_fsync)
+    storage.offline = True
+    upload = uploads.StreamingUpload(FakeBlob(storage, 'videos/a.mp4'), 'video/mp4', str(tmp_path / 'a'))
+    upload.write(os.urandom(CHUNK))
+    uploads.UploadQueue(FakeBucket(storage), FakeDB()).submit(upload, 'videos', {'name': 'a'})
+    assert synced == [upload.spool_path, os.path.join(uploads.UPLOAD_JOURNAL_DIR, 'videos_a.mp4.json.tmp')]
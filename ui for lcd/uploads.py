@@ -0,0 +1,476 @@
+import os
+import json
+import queue
+import logging
+import threading
+import requests
+from firebase_admin import firestore
+
+logger = logging.getLogger(__name__)
+
+# Resumable upload settings
+UPLOAD_CHUNK_SIZE = 4 * 256 * 1024  # Chunks must be a multiple of 256 KiB
+UPLOAD_TIMEOUT = 30  # Seconds per chunk request
+UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR", "upload_spool")
+UPLOAD_BUFFER_MAX = int(os.environ.get("UPLOAD_BUFFER_MB", "8")) * 1024 * 1024  # Unsent bytes held in memory
+
+# Background upload queue settings
+UPLOAD_JOURNAL_DIR = os.path.join(UPLOAD_SPOOL_DIR, "journal")
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", "2"))
+UPLOAD_RETRY_BASE = 5  # Seconds before the first retry, doubled on every failure
+UPLOAD_RETRY_MAX = 600  # Never wait longer than this between retries
+UPLOAD_BATCH_SIZE = 20  # Metadata documents per Firestore batch
+UPLOAD_BATCH_DELAY = 2.0  # Seconds to wait for more documents before committing
+
+
+class StreamingUpload:
+    """Uploads data to a Storage blob while it is still being produced.
+
+    Acts as a file-like sink for an encoder: write() only buffers, and a
+    sender thread PUTs every full chunk to a resumable upload session as
+    soon as it is buffered, so the encoder is never held up by the network
+    and when it finishes only the last partial chunk is left to send. If the
+    session cannot be opened, a chunk fails (no network) or more than
+    UPLOAD_BUFFER_MAX bytes pile up (slow uplink), everything not yet
+    accepted by Storage is spooled to spool_path instead. finish() moves
+    the unsent tail to the spool too, after which the spool file and state()
+    describe exactly what is left, and resume() sends it. The spool file is
+    left in place for the caller to remove once the result is recorded.
+
+    If the session expires while bytes that were already sent are no longer
+    held anywhere, or the spool turns out shorter than what was written to
+    it (power lost before it reached the disk), the upload cannot be
+    completed: it is marked failed and whatever is still spooled is kept
+    rather than uploaded as a truncated blob.
+    """
+
+    def __init__(self, blob, content_type, spool_path, session_url=None, offset=0, spool_offset=0,
+                 length=None):
+        self.blob = blob
+        self.content_type = content_type
+        self.spool_path = spool_path
+        self.session_url = session_url
+        self.offset = offset  # Bytes confirmed by Storage
+        self.spool_offset = spool_offset  # Blob offset of the first byte in the spool file
+        self.length = offset if length is None else length  # Bytes written so far, the blob's final size once finished
+        self.buffer = bytearray()
+        self.buffer_offset = offset  # Blob offset of the first byte in buffer
+        self.spool = None
+        self.condition = threading.Condition()
+        self.sender = None
+        self.finished = False
+        self.spooled = False  # The spool file exists and holds everything from spool_offset
+        self.failed = False
+
+    def write(self, data):
+        """Queue encoder output for the sender thread; never waits for the network"""
+        with self.condition:
+            self.length += len(data)
+            if self.spool is not None:
+                self.spool.write(data)
+                return
+            self.buffer += data
+            if len(self.buffer) > UPLOAD_BUFFER_MAX:
+                # The uplink can't keep up: keep the rest on disk from here on
+                logger.warning(f"Upload of {self.blob.name} falling behind, spooling to {self.spool_path}")
+                self._start_spool()
+            if self.sender is None:
+                self.sender = threading.Thread(target=self._send_loop, daemon=True)
+                self.sender.start()
+            self.condition.notify()
+
+    def finish(self):
+        """Stop accepting data and move everything not yet sent to the spool file"""
+        with self.condition:
+            self.finished = True
+            self.condition.notify()
+        # Only waits for a chunk that is already in flight
+        if self.sender is not None:
+            self.sender.join()
+        with self.condition:
+            if self.spool is None:
+                self._start_spool()
+            if not self.spool.closed:
+                # The journal entry written after this describes the spool, so it must be on disk first
+                self.spool.flush()
+                os.fsync(self.spool.fileno())
+                self.spool.close()
+
+    def abort(self):
+        """Give up on the upload: stop the sender, cancel the session and delete the spool"""
+        with self.condition:
+            self.finished = True
+            self.buffer.clear()
+            self.condition.notify()
+        if self.sender is not None:
+            self.sender.join()
+        with self.condition:
+            if self.spool is not None:
+                self.spool.close()
+        if self.session_url is not None:
+            try:
+                # Storage drops the bytes it already received for a cancelled session
+                requests.delete(self.session_url, timeout=UPLOAD_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"Could not cancel upload session for {self.blob.name}: {e}")
+            self.session_url = None
+        try:
+            os.remove(self.spool_path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Could not remove upload spool {self.spool_path}: {e}")
+
+    def state(self):
+        """Everything needed to rebuild this upload with from_state()"""
+        return {
+            'content_type': self.content_type,
+            'spool_path': self.spool_path,
+            'session_url': self.session_url,
+            'offset': self.offset,
+            'spool_offset': self.spool_offset,
+            'length': self.length,
+            'failed': self.failed,
+        }
+
+    @classmethod
+    def from_state(cls, blob, state):
+        upload = cls(blob, state['content_type'], state['spool_path'],
+                     session_url=state['session_url'], offset=state['offset'],
+                     spool_offset=state['spool_offset'])
+        upload.length = state.get('length')  # None for journal entries from before lengths were recorded
+        upload.spooled = True
+        upload.failed = state.get('failed', False)
+        return upload
+
+    def resume(self):
+        """Upload the spooled remainder from the confirmed offset; safe to call again"""
+        if self.failed:
+            return False
+        try:
+            spooled = os.path.getsize(self.spool_path)
+        except FileNotFoundError:
+            spooled = 0
+        if self.length is not None and spooled != self.length - self.spool_offset:
+            # Finalizing now would publish a truncated blob as the whole recording
+            logger.error(f"Upload spool for {self.blob.name} holds {spooled} bytes, "
+                         f"expected {self.length - self.spool_offset}, upload failed")
+            self.failed = True
+            return False
+        try:
+            with open(self.spool_path, 'rb') as f:
+                f.seek(self.offset - self.spool_offset)
+                while True:
+                    chunk = f.read(UPLOAD_CHUNK_SIZE)
+                    if len(chunk) < UPLOAD_CHUNK_SIZE:
+                        if self._put(chunk, total=self.offset + len(chunk)) != len(chunk):
+                            return False
+                        break
+                    if self._put(chunk) != len(chunk):
+                        return False
+            logger.debug(f"Finished upload of {self.blob.name}")
+            return True
+        except Exception as e:
+            logger.error(f"Error resuming upload of {self.blob.name}: {e}")
+            return False
+
+    def _send_loop(self):
+        """PUT full chunks from the buffer until finished, spooling or offline"""
+        while True:
+            with self.condition:
+                while not self.finished and self.spool is None and len(self.buffer) < UPLOAD_CHUNK_SIZE:
+                    self.condition.wait()
+                if self.finished or self.spool is not None:
+                    return
+                chunk = bytes(self.buffer[:UPLOAD_CHUNK_SIZE])
+            accepted = self._put(chunk) or 0
+            with self.condition:
+                if self.spool is None:
+                    del self.buffer[:accepted]
+                    self.buffer_offset += accepted
+                if accepted < len(chunk):
+                    if self.spool is None:
+                        # Offline: keep the rest on disk from here on
+                        logger.warning(f"Upload of {self.blob.name} spooling to {self.spool_path}")
+                        self._start_spool()
+                    return
+
+    def _start_spool(self):
+        """Move the buffer to the spool file; called with the lock held"""
+        os.makedirs(os.path.dirname(self.spool_path) or '.', exist_ok=True)
+        self.spool = open(self.spool_path, 'wb')
+        self.spool_offset = self.buffer_offset
+        self.spool.write(self.buffer)
+        self.buffer.clear()
+        self.spooled = True
+
+    def _put(self, chunk, total=None):
+        """PUT one chunk to the session.
+
+        Returns how many of the chunk's bytes Storage accepted, or None when
+        the request failed.
+        """
+        try:
+            if self.session_url is None:
+                self.session_url = self.blob.create_resumable_upload_session(content_type=self.content_type)
+            if total is None:
+                content_range = f"bytes {self.offset}-{self.offset + len(chunk) - 1}/*"
+            elif chunk:
+                content_range = f"bytes {self.offset}-{self.offset + len(chunk) - 1}/{total}"
+            else:
+                content_range = f"bytes */{total}"
+            response = requests.put(self.session_url, data=chunk,
+                                    headers={'Content-Range': content_range},
+                                    timeout=UPLOAD_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Upload of {self.blob.name} interrupted: {e}")
+            return None
+
+        if response.status_code in (200, 201):
+            self.offset += len(chunk)
+            return len(chunk)
+        if response.status_code == 308:
+            # Storage reports how much it has actually persisted
+            confirmed = self.offset
+            if 'Range' in response.headers:
+                confirmed = int(response.headers['Range'].rsplit('-', 1)[1]) + 1
+            accepted = max(0, confirmed - self.offset)
+            self.offset = confirmed
+            return accepted
+        if response.status_code in (404, 410):
+            if self.spooled and self.spool_offset == 0:
+                # The session expired, but the spool still holds the whole blob
+                logger.warning(f"Upload session for {self.blob.name} expired, starting over")
+                self.session_url = None
+                self.offset = 0
+                return None
+            # The bytes already sent are gone, a new session could only produce a truncated blob
+            logger.error(f"Upload session for {self.blob.name} expired after {self.offset} bytes, upload failed")
+            self.failed = True
+            return None
+        logger.warning(f"Upload of {self.blob.name} failed: HTTP {response.status_code}")
+        return None
+
+
+class UploadQueue:
+    """Durable background queue that finishes uploads and publishes them.
+
+    Every submitted upload gets a journal entry in UPLOAD_JOURNAL_DIR with
+    its resumable session state and the Firestore document to create, so
+    pending uploads survive network outages and restarts. A pool of worker
+    threads resumes each upload from its spool file, retrying with
+    exponential backoff, and makes the finished blob public. A single
+    publisher thread then writes the metadata documents in Firestore
+    batches and removes the journal entries once they are committed. Each
+    document's ID is derived from its blob name, so committing a batch
+    again after a crash overwrites the same documents instead of adding
+    duplicates. Uploads that fail for good keep their spool file, and their
+    journal entry is renamed to .failed so it is no longer retried.
+    """
+
+    def __init__(self, bucket, db, on_published=None, workers=UPLOAD_WORKERS):
+        self.bucket = bucket
+        self.db = db
+        self.on_published = on_published
+        self.workers = workers
+        self.uploads = queue.Queue()
+        self.documents = queue.Queue()
+        self.timers = {}  # Pending retry timers by blob name
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        """Start the workers and pick up anything left in the journal"""
+        os.makedirs(UPLOAD_JOURNAL_DIR, exist_ok=True)
+        for entry in sorted(os.listdir(UPLOAD_JOURNAL_DIR)):
+            if not entry.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(UPLOAD_JOURNAL_DIR, entry)) as f:
+                    job = json.load(f)
+            except Exception as e:
+                logger.error(f"Skipping unreadable upload journal entry {entry}: {e}")
+                continue
+            logger.info(f"Resuming pending upload of {job['blob']}")
+            if job['url'] is None:
+                self.uploads.put(job)
+            else:
+                self.documents.put(job)
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._upload_worker, name=f"upload-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        thread = threading.Thread(target=self._publish_worker, name="upload-publish", daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def stop(self):
+        """Stop the workers; unfinished jobs stay in the journal for next time"""
+        self.stop_event.set()
+        with self.lock:
+            for timer in self.timers.values():
+                timer.cancel()
+            self.timers.clear()
+        for _ in range(self.workers):
+            self.uploads.put(None)
+        self.documents.put(None)
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        self.threads = []
+
+    def submit(self, upload, collection, document):
+        """Hand a StreamingUpload whose encoder has finished over to the queue.
+
+        document is the Firestore metadata to add to collection; its 'url',
+        'storagePath' and 'timestamp' fields are filled in when it is published.
+        """
+        upload.finish()
+        job = dict(upload.state(), blob=upload.blob.name, collection=collection,
+                   document=document, complete=False, url=None, attempts=0)
+        self._save(job)
+        self.uploads.put(job)
+        logger.debug(f"Queued upload of {job['blob']}")
+
+    def pending(self):
+        """Number of uploads still waiting in the journal"""
+        try:
+            return sum(1 for entry in os.listdir(UPLOAD_JOURNAL_DIR) if entry.endswith('.json'))
+        except FileNotFoundError:
+            return 0
+
+    def _upload_worker(self):
+        while True:
+            job = self.uploads.get()
+            if job is None or self.stop_event.is_set():
+                return
+            blob = self.bucket.blob(job['blob'])
+            if not job['complete']:
+                upload = StreamingUpload.from_state(blob, job)
+                job['complete'] = upload.resume()
+                job.update(upload.state())
+                if job['failed']:
+                    self._fail(job)
+                    continue
+                self._save(job)
+            if job['complete']:
+                # Only forget the spooled data once the journal says it was all sent
+                self._remove_spool(job)
+                try:
+                    blob.make_public()
+                    job['url'] = blob.public_url
+                    job['attempts'] = 0
+                except Exception as e:
+                    logger.warning(f"Could not make {job['blob']} public: {e}")
+            self._save(job)
+            if job['url'] is not None:
+                self.documents.put(job)
+            else:
+                self._retry(job, self.uploads)
+
+    def _publish_worker(self):
+        while True:
+            job = self.documents.get()
+            if job is None:
+                return
+            jobs = [job]
+            # Give other uploads a moment to finish so their documents share the batch
+            while len(jobs) < UPLOAD_BATCH_SIZE and not self.stop_event.is_set():
+                try:
+                    job = self.documents.get(timeout=UPLOAD_BATCH_DELAY)
+                except queue.Empty:
+                    break
+                if job is None:
+                    break
+                jobs.append(job)
+
+            try:
+                batch = self.db.batch()
+                for job in jobs:
+                    document = dict(job['document'], url=job['url'], storagePath=job['blob'],
+                                    timestamp=firestore.SERVER_TIMESTAMP)
+                    batch.set(self.db.collection(job['collection']).document(self._document_id(job)), document)
+                batch.commit()
+            except Exception as e:
+                logger.warning(f"Could not write {len(jobs)} upload documents: {e}")
+                for job in jobs:
+                    self._retry(job, self.documents)
+            else:
+                for job in jobs:
+                    self._remove(job)
+                    logger.info(f"Successfully uploaded {job['blob']} to Firebase Storage")
+                    if self.on_published:
+                        try:
+                            self.on_published(job)
+                        except Exception as e:
+                            logger.error(f"Error in upload callback: {e}")
+
+            if self.stop_event.is_set():
+                return
+
+    def _retry(self, job, target):
+        """Put the job back on target after an exponential backoff"""
+        if self.stop_event.is_set():
+            return
+        job['attempts'] += 1
+        delay = min(UPLOAD_RETRY_MAX, UPLOAD_RETRY_BASE * 2 ** (job['attempts'] - 1))
+        logger.info(f"Retrying {job['blob']} in {delay}s (attempt {job['attempts']})")
+        self._save(job)
+
+        def requeue():
+            with self.lock:
+                self.timers.pop(job['blob'], None)
+            target.put(job)
+
+        timer = threading.Timer(delay, requeue)
+        timer.daemon = True
+        with self.lock:
+            self.timers[job['blob']] = timer
+        timer.start()
+
+    def _document_id(self, job):
+        """Firestore document ID for a job, the same every time it is published"""
+        return job['blob'].replace('/', '_')
+
+    def _fail(self, job):
+        """Stop retrying a job that can never finish, keeping its data for inspection"""
+        self._save(job)
+        path = self._journal_path(job)
+        try:
+            os.replace(path, path + '.failed')
+        except Exception as e:
+            logger.error(f"Could not set aside upload journal for {job['blob']}: {e}")
+        logger.error(f"Upload of {job['blob']} failed for good, spooled data kept in {job['spool_path']}")
+
+    def _remove_spool(self, job):
+        try:
+            os.remove(job['spool_path'])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Could not remove upload spool for {job['blob']}: {e}")
+
+    def _journal_path(self, job):
+        return os.path.join(UPLOAD_JOURNAL_DIR, job['blob'].replace('/', '_') + '.json')
+
+    def _save(self, job):
+        """Atomically rewrite the job's journal entry"""
+        path = self._journal_path(job)
+        try:
+            os.makedirs(UPLOAD_JOURNAL_DIR, exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(job, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            logger.error(f"Could not write upload journal for {job['blob']}: {e}")
+
+    def _remove(self, job):
+        try:
+            os.remove(self._journal_path(job))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Could not remove upload journal for {job['blob']}: {e}")